@@ -0,0 +1,106 @@
+import threading
+import time
+import numpy as np
+from cachetools import TTLCache
+from utils import get_artifact_key, ANSWER_CACHE_SIZE, ANSWER_CACHE_TTL, ANSWER_CACHE_THRESHOLD
+
+# Process-wide cache of generated answers, shared by every Streamlit session.
+#
+# Entries are keyed by the set of papers the question was asked against
+# (their content-addressed artifact keys, so reprocessed papers never reuse
+# stale answers) and the normalised query text. A lookup first tries the exact
+# query, then the most similar cached query for the same papers by cosine
+# similarity of the query embeddings, so "what is multi-head attention" and
+# "What is multi-head attention?" share one answer. Entries expire after a TTL
+# and the least recently used ones are evicted when the cache is full. Earlier
+# questions that go into the prompt are part of the key too, so a follow-up
+# such as "can you elaborate?" only matches within the same conversation context.
+
+_answer_cache = TTLCache(maxsize=ANSWER_CACHE_SIZE, ttl=ANSWER_CACHE_TTL)
+_answer_cache_lock = threading.Lock()
+answer_cache_stats = {"hits": 0, "similar_hits": 0, "misses": 0, "stores": 0}
+
+def get_paper_set_key(pdf_paths, model_name="", conversation_context=()):
+    """
+    Identifies a selection of papers (order-independent), the model answering
+    over them and the earlier questions included in the prompt.
+    """
+    return (model_name, tuple(sorted(get_artifact_key(pdf_path) for pdf_path in pdf_paths)),
+            tuple(_normalize_query(question) for question in conversation_context))
+
+def _normalize_query(query):
+    """Lower-cases a query and collapses whitespace and trailing punctuation."""
+    return " ".join(query.lower().split()).rstrip(" ?!.")
+
+def _as_unit_vector(embedding):
+    """Flattens an embedding to a float32 vector of unit length."""
+    vector = np.asarray(embedding, dtype=np.float32).reshape(-1)
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+def lookup_answer(query, query_embedding, pdf_paths, model_name="", conversation_context=(),
+                  threshold=ANSWER_CACHE_THRESHOLD):
+    """
+    Finds a cached answer to the same or a near-duplicate question about the same papers.
+
+    Args:
+        query (str): The user's question.
+        query_embedding (np.ndarray): Embedding of the question, or None for exact matching only.
+        pdf_paths (list): Selected papers.
+        model_name (str): Model the answer must come from.
+        conversation_context (sequence): Earlier questions added to the prompt as context.
+        threshold (float): Minimum cosine similarity for a near-duplicate question.
+
+    Returns:
+        dict: The cached entry (``query``, ``answer``, ``created_at``) plus the
+        ``similarity`` of the match, or None on a miss.
+    """
+    paper_set_key = get_paper_set_key(pdf_paths, model_name, conversation_context)
+    exact_key = (paper_set_key, _normalize_query(query))
+    vector = _as_unit_vector(query_embedding) if query_embedding is not None else None
+    with _answer_cache_lock:
+        entry = _answer_cache.get(exact_key)
+        if entry is not None:
+            answer_cache_stats["hits"] += 1
+            return {**entry, "similarity": 1.0}
+        best_key, best_similarity = None, threshold
+        if vector is not None:
+            _answer_cache.expire()
+            for key, candidate in _answer_cache.items():
+                if key[0] != paper_set_key or candidate["embedding"].shape != vector.shape:
+                    continue
+                similarity = float(candidate["embedding"] @ vector)
+                if similarity >= best_similarity:
+                    best_key, best_similarity = key, similarity
+        if best_key is None:
+            answer_cache_stats["misses"] += 1
+            return None
+        entry = _answer_cache[best_key]  # Reading through the cache marks the entry as recently used
+        answer_cache_stats["similar_hits"] += 1
+    print(f"[DEBUG] Answer cache: reusing answer to '{entry['query']}' (similarity {best_similarity:.3f})")
+    return {**entry, "similarity": best_similarity}
+
+def store_answer(query, query_embedding, pdf_paths, answer, model_name="", conversation_context=()):
+    """Caches an answer; error messages and empty answers are not cached."""
+    if not answer or not answer.strip() or answer.lstrip().startswith(("⚠️", "I could not find")):
+        return
+    key = (get_paper_set_key(pdf_paths, model_name, conversation_context), _normalize_query(query))
+    entry = {
+        "query": query,
+        "answer": answer,
+        "embedding": _as_unit_vector(query_embedding) if query_embedding is not None else np.zeros(0, np.float32),
+        "created_at": time.time(),
+    }
+    with _answer_cache_lock:
+        _answer_cache[key] = entry
+        answer_cache_stats["stores"] += 1
+
+def get_answer_cache_stats():
+    """Returns hit/miss counters and the number of cached answers."""
+    with _answer_cache_lock:
+        return {**answer_cache_stats, "entries": len(_answer_cache), "max_entries": _answer_cache.maxsize}
+
+def clear_answer_cache():
+    """Drops every cached answer."""
+    with _answer_cache_lock:
+        _answer_cache.clear()
@@ -6,13 +6,18 @@ st.set_page_config(page_title="📝 ArxivLensAI", layout="wide")
 
 from sentence_transformers import SentenceTransformer
 import pickle
-from qa_system import generate_answer_huggingface, set_api_keys, set_gemini_model_name
-from vector_store import search_faiss, load_faiss_index, initialize_embedding_model, get_embedding_model
+from qa_system import generate_answer_huggingface, set_api_keys, set_gemini_model_name, get_previous_questions
+from vector_store import search_papers, initialize_embedding_model, get_embedding_model, encode_query
 import os
 import faiss
-from main import process_pdf
+from ingest_queue import submit_job, get_job, get_jobs, ensure_worker_running
 from extract_text import extract_text_from_images
-from utils import get_faiss_index_filename, get_chunks_filename, full_context_keywords,  GOOGLE_API_KEY, HUGGINGFACE_API_KEY
+from table_store import search_tables
+from answer_cache import lookup_answer, store_answer
+from reranker import rerank
+from summarizer import summarize_papers
+from utils import (is_pdf_processed, full_context_keywords, is_summary_request, GOOGLE_API_KEY,
+                   HUGGINGFACE_API_KEY, RERANK_ENABLED, RERANK_CANDIDATES, RERANK_TOP_N)
 import pandas as pd
 from fuzzywuzzy import process
 import time
@@ -56,34 +61,52 @@ st.markdown("<h3 style='text-align: center;'>🤖 ArxivLensAI (An AI-Powered Res
 st.sidebar.header("📄 Upload Research Papers")
 uploaded_files = st.sidebar.file_uploader("Upload PDFs", type="pdf", accept_multiple_files=True)
 
+# ✅ Papers are ingested by a background worker; the script only queues them and polls
+if "ingest_jobs" not in st.session_state:
+    st.session_state.ingest_jobs = {}  # display name -> ingestion job id
+if "upload_ids" not in st.session_state:
+    st.session_state.upload_ids = {}  # display name -> file uploader id of its latest upload
+
+def queue_paper(name, pdf_path, retry_failed=False):
+    """
+    Queues a paper for background ingestion (once per session) and returns its job record.
+
+    A failed job is only resubmitted with ``retry_failed``, so a broken PDF is
+    not retried on every rerun.
+    """
+    job_id = st.session_state.ingest_jobs.get(name)
+    job = get_job(job_id) if job_id else None
+    # Resubmit if this session has no job for it, a failed job is retried, or its artifacts have since disappeared
+    if (job is None or job["status"] == "failed" and retry_failed or
+            job["status"] == "done" and not is_pdf_processed(pdf_path)):
+        job = submit_job(pdf_path, name)
+        st.session_state.ingest_jobs[name] = job["id"]
+    if job["status"] in ("queued", "running"):
+        ensure_worker_running()
+    return job
+
 # ✅ Store uploaded papers
 available_papers = {}
 if uploaded_files:
     for uploaded_file in uploaded_files:
         print(f"[DEBUG] Processing uploaded file: {uploaded_file.name}")
         pdf_path = os.path.join(temp_dir, uploaded_file.name)
-        with open(pdf_path, "wb") as f:
-            f.write(uploaded_file.getbuffer())
-
-        # ✅ Show notification instead of sidebar clutter
-        st.toast(f"✅ {uploaded_file.name} uploaded!", icon="📄")
-
-        # ✅ Process PDF if necessary
+        # Rewrite only new or replaced files: the worker may be reading the current one
+        if not os.path.exists(pdf_path) or os.path.getsize(pdf_path) != uploaded_file.size:
+            st.session_state.ingest_jobs.pop(uploaded_file.name, None)
+            with open(pdf_path, "wb") as f:
+                f.write(uploaded_file.getbuffer())
+            # ✅ Show notification instead of sidebar clutter
+            st.toast(f"✅ {uploaded_file.name} uploaded!", icon="📄")
+
+        # ✅ Queue PDF for processing if necessary; uploading the file again retries a failed ingestion
+        new_upload = st.session_state.upload_ids.get(uploaded_file.name) != uploaded_file.file_id
+        st.session_state.upload_ids[uploaded_file.name] = uploaded_file.file_id
         try:
-            faiss_index_filename = get_faiss_index_filename(pdf_path)
-            faiss_index_path = os.path.join(faiss_indexes_dir, faiss_index_filename)
-            chunks_filename = os.path.join(faiss_indexes_dir, f"chunks_{faiss_index_filename}.pkl")
-
-            print(f"[DEBUG] Checking for existing index at: {faiss_index_path}")
-            if not os.path.exists(faiss_index_path) or not os.path.exists(chunks_filename):
-                print("[DEBUG] Index not found, processing PDF...")
-                process_pdf(pdf_path)
-            else:
-                print("[DEBUG] Found existing index")
-
-            available_papers[uploaded_file.name] = pdf_path
+            if queue_paper(uploaded_file.name, pdf_path, retry_failed=new_upload)["status"] == "done":
+                available_papers[uploaded_file.name] = pdf_path
         except Exception as e:
-            print(f"[ERROR] Failed to process {uploaded_file.name}: {e}")
+            print(f"[ERROR] Failed to queue {uploaded_file.name}: {e}")
             st.error(f"❌ Error processing {uploaded_file.name}: {str(e)}")
 
 # ✅ Load Default Paper if No Uploads
@@ -91,29 +114,39 @@ if not available_papers:
     st.sidebar.info("📌 Using default paper: Attention Is All You Need")
     if os.path.exists(default_paper_path):
         print(f"[DEBUG] Loading default paper from: {default_paper_path}")
-        available_papers["Attention Is All You Need (Default)"] = default_paper_path
-        
-        # Process default paper if needed
         try:
-            faiss_index_filename = get_faiss_index_filename(default_paper_path)
-            faiss_index_path = os.path.join(faiss_indexes_dir, faiss_index_filename)
-            chunks_filename = os.path.join(faiss_indexes_dir, f"chunks_{faiss_index_filename}.pkl")
-            
-            print(f"[DEBUG] Checking for default paper index at: {faiss_index_path}")
-            if not os.path.exists(faiss_index_path) or not os.path.exists(chunks_filename):
-                print("[DEBUG] Processing default paper...")
-                process_pdf(default_paper_path)
-            else:
-                print("[DEBUG] Found existing index for default paper")
+            if queue_paper("Attention Is All You Need (Default)", default_paper_path)["status"] == "done":
+                available_papers["Attention Is All You Need (Default)"] = default_paper_path
         except Exception as e:
-            print(f"[ERROR] Failed to process default paper: {e}")
+            print(f"[ERROR] Failed to queue default paper: {e}")
             st.error("⚠️ Error processing default paper!")
-            # Non-blocking notice for missing tesseract OCR
-            if "tesseract is not installed" in str(e).lower():
-                st.toast("Image OCR unavailable (install Tesseract for image text).", icon="ℹ️")
     else:
         st.error("⚠️ Default research paper is missing! Please upload a file.")
 
+# ✅ Ingestion progress, refreshed without rerunning the whole script
+session_jobs = get_jobs(list(st.session_state.ingest_jobs.values()))
+# Only jobs still in flight are polled; finished and failed ones need no refresh
+pending_job_ids = [job_id for job_id, job in session_jobs.items() if job["status"] in ("queued", "running")]
+for job_id, job in session_jobs.items():
+    if job["status"] == "failed":
+        st.sidebar.error(f"❌ Error processing {job['name']}: {job['error']}")
+        if st.sidebar.button("🔄 Retry", key=f"retry_ingest_{job_id}"):
+            queue_paper(job["name"], job["pdf_path"], retry_failed=True)
+            st.rerun()
+
+@st.fragment(run_every=2 if pending_job_ids else None)
+def show_ingestion_status():
+    jobs = get_jobs(pending_job_ids)
+    for job in jobs.values():
+        if job["status"] in ("queued", "running"):
+            st.progress(job["progress"], text=f"⏳ {job['name']}: {job['stage']}")
+    # Rerun the full script once a polled paper finishes (or fails), so the paper list and errors update
+    if any(job["status"] not in ("queued", "running") for job in jobs.values()):
+        st.rerun()
+
+with st.sidebar:
+    show_ingestion_status()
+
 # ✅ Dropdown to Select Research Papers
 selected_papers = st.sidebar.multiselect(
     "📂 Select Research Papers",
@@ -144,15 +177,6 @@ if gapi_key and gapi_key.startswith("AIza"):
         set_api_keys(gapi_key=gapi_key, hapi_key=None)
         if embedding_model is None:
             embedding_model = initialize_embedding_model()
-        if os.path.exists(default_paper_path) and embedding_model is not None:
-            # Prepare default index if missing
-            faiss_index_filename = get_faiss_index_filename(default_paper_path)
-            faiss_index_path = os.path.join(faiss_indexes_dir, faiss_index_filename)
-            chunks_filename = os.path.join(faiss_indexes_dir, f"chunks_{faiss_index_filename}.pkl")
-            if not os.path.exists(faiss_index_path) or not os.path.exists(chunks_filename):
-                st.toast("Preparing default paper index...", icon="🛠️")
-                process_pdf(default_paper_path)
-                st.toast("Default paper index ready.", icon="✅")
     except Exception as e:
         st.sidebar.error(f"Initialization error: {e}")
 elif gapi_key and not gapi_key.startswith("AIza"):
@@ -178,18 +202,6 @@ st.sidebar.markdown("License: [MIT]('https://github.com/pranavsinghpatil/ArxivLe
 
 # ------------------------------------------------------------
 
-# ✅ Ensure Selected Papers are Processed
-for pdf_path in st.session_state.selected_papers:
-    try:
-        faiss_index_filename = get_faiss_index_filename(pdf_path)
-        faiss_index_path = os.path.join(faiss_indexes_dir, faiss_index_filename)
-
-        if not os.path.exists(faiss_index_path):
-            process_pdf(pdf_path)
-
-    except Exception as e:
-        st.error(f"❌ Error processing {pdf_path}: {str(e)}")
-
 # ✅ Initialize chat history
 if "chat_history" not in st.session_state:
     st.session_state.chat_history = []
@@ -225,65 +237,81 @@ if query:
     st.chat_message("user", avatar=os.path.join(static_dir, "icons", "user-icon.png")).markdown(query)
     st.session_state.conversation_history.append({"role": "user", "content": query})
 
-    # Display assistant message with spinner while processing
+    # Display assistant message, with a spinner until the answer starts streaming
     with st.chat_message("assistant", avatar=os.path.join(static_dir, "icons", "bot-icon.png")):
-        with st.spinner("Thinking..."):
-            try:
-                # Load FAISS indexes for selected papers
-                print(f"[DEBUG] Selected papers: {st.session_state.selected_papers}")
-                all_chunks = []
-                all_indexes = []
-                
-                for pdf_path in st.session_state.selected_papers:
-                    try:
-                        print(f"[DEBUG] Loading index for: {pdf_path}")
-                        index, chunks = load_faiss_index(pdf_path)
-                        if index is not None and chunks is not None:
-                            all_indexes.append(index)
-                            all_chunks.extend(chunks)
-                            print(f"[DEBUG] Loaded {len(chunks)} chunks from {pdf_path}")
-                        else:
-                            print(f"[WARNING] Failed to load index for {pdf_path}")
-                    except Exception as e:
-                        print(f"[ERROR] Error loading index for {pdf_path}: {e}")
-                        continue
-
-                if not all_chunks or not all_indexes:
-                    st.error("❌ No valid indexes found for the selected papers!")
-                    st.stop()
-
-                print(f"[DEBUG] Total chunks loaded: {len(all_chunks)}")
-                
-                # Search for relevant chunks
-                relevant_chunks = []
-                for index, chunks in zip(all_indexes, [all_chunks]):
-                    try:
-                        chunks_found = search_faiss(query, index, embedding_model, chunks, 
-                                                  st.session_state.conversation_history)
-                        if chunks_found and chunks_found[0] != "Error:":
-                            relevant_chunks.extend(chunks_found)
-                            print(f"[DEBUG] Found {len(chunks_found)} relevant chunks")
-                    except Exception as e:
-                        print(f"[ERROR] FAISS search failed: {e}")
-                        continue
-
-                if not relevant_chunks:
-                    st.error("❌ Could not find relevant information in the papers!")
-                    st.stop()
-
-                # Generate answer
-                answer = generate_answer_huggingface(
-                    query=query,
-                    retrieved_chunks=relevant_chunks,
-                    memory=st.session_state.conversation_history,
-                    image_texts=[],  # TODO: Add image text support
-                    table_texts=[],   # TODO: Add table text support
-                    full_context=False
-                )
-
-                st.markdown(answer)
-                st.session_state.conversation_history.append({"role": "assistant", "content": answer})
-                
-            except Exception as e:
-                print(f"[ERROR] Failed to process query: {e}")
-                st.error(f"❌ Error: {str(e)}")
+        try:
+            # Latency is measured from the moment the question arrives
+            answer_metrics = {"started_at": time.perf_counter()}
+            # Repeated and near-duplicate questions about the same papers reuse an earlier answer
+            query_embedding = encode_query(query, embedding_model)
+            # Earlier questions shape the prompt, so answers are only shared within the same context
+            conversation_context = get_previous_questions(st.session_state.conversation_history)[:-1]
+            cached = lookup_answer(query, query_embedding, st.session_state.selected_papers, selected_model,
+                                   conversation_context)
+            if cached:
+                st.markdown(cached["answer"])
+                st.caption(f"⚡ Cached answer to a similar question ({cached['similarity']:.0%} match), "
+                           f"served in {time.perf_counter() - answer_metrics['started_at']:.2f}s")
+                st.session_state.conversation_history.append({"role": "assistant", "content": cached["answer"]})
+                st.stop()
+
+            # Summaries and comparisons are answered from section summaries of the whole papers
+            if is_summary_request(query):
+                with st.spinner("Summarising the papers section by section..."):
+                    paper_names = {path: name for name, path in available_papers.items()}
+                    answer_stream = summarize_papers(query, st.session_state.selected_papers, paper_names,
+                                                     stream=True, metrics=answer_metrics)
+            else:
+                with st.spinner("Thinking..."):
+                    # Search every selected paper and merge the top hits across papers
+                    print(f"[DEBUG] Selected papers: {st.session_state.selected_papers}")
+                    # With re-ranking, retrieve a wider candidate set and let the cross-encoder pick the best few
+                    hits = search_papers(query, st.session_state.selected_papers, embedding_model,
+                                         st.session_state.conversation_history,
+                                         k=RERANK_CANDIDATES if RERANK_ENABLED else 5)
+                    if RERANK_ENABLED:
+                        hits = rerank(query, hits, top_n=RERANK_TOP_N)
+                    relevant_chunks = [hit["text"] for hit in hits]
+
+                    if not relevant_chunks:
+                        st.error("❌ Could not find relevant information in the papers!")
+                        st.stop()
+
+                    print(f"[DEBUG] Found {len(relevant_chunks)} relevant chunks")
+
+                    # Pull tables the question refers to ("Table 2") or whose caption/header matches it
+                    table_hits = search_tables(query, st.session_state.selected_papers)
+                    print(f"[DEBUG] Found {len(table_hits)} relevant tables")
+                    answer_metrics["retrieval"] = time.perf_counter() - answer_metrics["started_at"]
+
+                    # Prepare the context and open the answer stream
+                    answer_stream = generate_answer_huggingface(
+                        query=query,
+                        retrieved_chunks=relevant_chunks,
+                        memory=st.session_state.conversation_history,
+                        image_texts=[],  # TODO: Add image text support
+                        table_texts=[hit["markdown"] for hit in table_hits],
+                        full_context=False,
+                        stream=True,
+                        metrics=answer_metrics,
+                        max_chunks=RERANK_TOP_N if RERANK_ENABLED else 3,
+                        extract_span=not RERANK_ENABLED,
+                    )
+
+            # Render the answer as Gemini produces it
+            answer = st.write_stream(answer_stream)
+            if "ttft" in answer_metrics:
+                st.caption(f"⏱️ First words after {answer_metrics['ttft']:.1f}s, "
+                           f"complete after {answer_metrics['total']:.1f}s · "
+                           f"~{answer_metrics.get('prompt_tokens', 0)} prompt tokens")
+                st.session_state.setdefault("answer_latencies", []).append(
+                    {key: value for key, value in answer_metrics.items() if key != "started_at"})
+            st.session_state.conversation_history.append({"role": "assistant", "content": answer})
+            # An answer whose stream broke off mid-way is shown but never cached
+            if isinstance(answer, str) and not answer_metrics.get("failed"):
+                store_answer(query, query_embedding, st.session_state.selected_papers, answer, selected_model,
+                             conversation_context)
+            
+        except Exception as e:
+            print(f"[ERROR] Failed to process query: {e}")
+            st.error(f"❌ Error: {str(e)}")
@@ -0,0 +1,131 @@
+import json
+import os
+import numpy as np
+
+# Columnar, memory-mapped store of text chunks.
+#
+# A store is identified by its JSON header path (``<prefix>.json``) and has
+# three sibling files:
+#   <prefix>.offsets.npy  - int64 byte offsets into the text blob (n + 1 entries)
+#   <prefix>.text         - every chunk's UTF-8 bytes, concatenated
+#   <prefix>.meta.npy     - structured per-chunk metadata (page, section, char span, deleted flag)
+# Section headings are stored once in the header and referenced by position.
+# Chunk ids are row numbers. Removed chunks stay as empty, deleted rows so ids
+# remain stable for ID-mapped FAISS indexes.
+
+CHUNK_METADATA_DTYPE = np.dtype([
+    ("page", "<i4"),
+    ("section", "<i4"),
+    ("char_start", "<i8"),
+    ("char_end", "<i8"),
+    ("deleted", "?"),
+])
+
+def _store_prefix(header_path):
+    """Strips the .json suffix from a store's header path."""
+    return header_path[:-len(".json")] if header_path.endswith(".json") else header_path
+
+def write_chunk_store(header_path, chunks, metadata=None, paper_id=""):
+    """
+    Writes chunks and their metadata as a columnar chunk store.
+
+    Args:
+        header_path (str): Path of the store's JSON header.
+        chunks (list): Chunk texts; None marks a deleted chunk id.
+        metadata (list): Optional dicts with ``page``, ``section``, ``char_start``
+            and ``char_end`` per chunk; unknown values are stored as -1.
+        paper_id (str): Identifier of the paper the chunks belong to.
+    """
+    prefix = _store_prefix(header_path)
+    metadata = metadata or [{}] * len(chunks)
+    offsets = np.zeros(len(chunks) + 1, dtype="<i8")
+    rows = np.zeros(len(chunks), dtype=CHUNK_METADATA_DTYPE)
+    sections = {}  # heading -> position in the header's section list
+
+    # Write to temporary names and swap in, so readers never see a partial store
+    with open(f"{prefix}.text.tmp", "wb") as f:
+        for i, (chunk, meta) in enumerate(zip(chunks, metadata)):
+            encoded = chunk.encode("utf-8") if chunk is not None else b""
+            f.write(encoded)
+            offsets[i + 1] = offsets[i] + len(encoded)
+            section = meta.get("section") or ""
+            section_id = sections.setdefault(section, len(sections)) if section else -1
+            rows[i] = (meta.get("page", -1), section_id, meta.get("char_start", -1), meta.get("char_end", -1), chunk is None)
+    with open(f"{prefix}.offsets.npy.tmp", "wb") as f:
+        np.save(f, offsets)
+    with open(f"{prefix}.meta.npy.tmp", "wb") as f:
+        np.save(f, rows)
+    for suffix in [".text", ".offsets.npy", ".meta.npy"]:
+        os.replace(f"{prefix}{suffix}.tmp", f"{prefix}{suffix}")
+
+    # The header is written last and marks the store as complete
+    with open(f"{header_path}.tmp", "w", encoding="utf-8") as f:
+        json.dump({"paper_id": paper_id, "count": len(chunks), "sections": list(sections)}, f)
+    os.replace(f"{header_path}.tmp", header_path)
+
+def delete_chunk_store(header_path):
+    """Removes a chunk store's header and data files if present."""
+    prefix = _store_prefix(header_path)
+    for file_path in [header_path, f"{prefix}.text", f"{prefix}.offsets.npy", f"{prefix}.meta.npy"]:
+        if os.path.exists(file_path):
+            os.remove(file_path)
+
+class ChunkStore:
+    """
+    Read-only, memory-mapped view of a chunk store that behaves like a list of
+    chunk texts: indexing decodes only the requested chunk, so searches fetch
+    their k hits without materialising the rest of the corpus.
+    """
+
+    def __init__(self, header_path):
+        prefix = _store_prefix(header_path)
+        with open(header_path, "r", encoding="utf-8") as f:
+            header = json.load(f)
+        self.paper_id = header.get("paper_id", "")
+        self.sections = header.get("sections", [])
+        self.offsets = np.load(f"{prefix}.offsets.npy", mmap_mode="r")
+        self.meta = np.load(f"{prefix}.meta.npy", mmap_mode="r")
+        text_path = f"{prefix}.text"
+        # np.memmap cannot map an empty file
+        if os.path.getsize(text_path) > 0:
+            self._text = np.memmap(text_path, dtype=np.uint8, mode="r")
+        else:
+            self._text = np.zeros(0, dtype=np.uint8)
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, chunk_id):
+        if chunk_id < 0:
+            chunk_id += len(self)
+        if not 0 <= chunk_id < len(self):
+            raise IndexError(f"Chunk id {chunk_id} out of range")
+        if self.meta["deleted"][chunk_id]:
+            return None
+        start, end = int(self.offsets[chunk_id]), int(self.offsets[chunk_id + 1])
+        return self._text[start:end].tobytes().decode("utf-8")
+
+    def __iter__(self):
+        for chunk_id in range(len(self)):
+            yield self[chunk_id]
+
+    def get_many(self, chunk_ids):
+        """Returns the texts of several chunk ids."""
+        return [self[int(chunk_id)] for chunk_id in chunk_ids]
+
+    def metadata(self, chunk_id):
+        """Returns the provenance of one chunk."""
+        row = self.meta[chunk_id]
+        section_id = int(row["section"])
+        return {
+            "chunk_id": int(chunk_id),
+            "paper_id": self.paper_id,
+            "page": int(row["page"]),
+            "section": self.sections[section_id] if section_id >= 0 else "",
+            "char_start": int(row["char_start"]),
+            "char_end": int(row["char_end"]),
+        }
+
+    def resident_bytes(self):
+        """Approximates the memory pinned by the store outside the OS page cache."""
+        return self.offsets.nbytes + self.meta.nbytes
@@ -0,0 +1,245 @@
+import re
+
+# Pluggable chunkers that turn one page of extracted text into chunks with
+# provenance. Each chunker takes (text, page_number, section, max_tokens,
+# overlap_tokens, count_tokens) and returns (chunks, section), where chunks
+# are dicts with ``text``, ``page``, ``section``, ``char_start`` and
+# ``char_end`` (offsets into the page text) and section is the heading in
+# effect at the end of the page, carried into the next page.
+
+CHUNKERS = {}
+
+def register_chunker(name):
+    """Decorator registering a chunker function under a strategy name."""
+    def decorator(func):
+        CHUNKERS[name] = func
+        return func
+    return decorator
+
+def approximate_token_count(text):
+    """Estimates word-piece tokens when no model tokenizer is available."""
+    return int(len(re.findall(r"\w+|[^\w\s]", text)) * 1.2) + 2
+
+def normalize_chunk_text(text):
+    """Joins words hyphenated across line breaks and collapses whitespace."""
+    text = text.replace("\x00", "")
+    text = re.sub(r"(\w)-\s*\n\s*(\w)", r"\1\2", text)
+    return re.sub(r"\s+", " ", text).strip()
+
+# Abbreviations whose trailing period does not end a sentence
+ABBREVIATIONS = {
+    "al", "fig", "figs", "eq", "eqs", "sec", "secs", "tab", "e.g", "i.e", "vs", "cf", "etc", "approx",
+    "resp", "no", "nos", "ref", "refs", "vol", "pp", "ch", "thm", "def", "dr", "mr", "mrs", "ms", "prof",
+    "st", "jr", "inc", "ltd", "co", "corp", "dept", "univ", "appx", "alg", "est", "min", "max",
+}
+SECTION_NAMES = {
+    "abstract", "introduction", "related work", "background", "method", "methods", "methodology", "model",
+    "approach", "experiments", "experimental setup", "evaluation", "results", "discussion", "analysis",
+    "conclusion", "conclusions", "future work", "references", "bibliography", "acknowledgements",
+    "acknowledgments", "appendix", "limitations",
+}
+# Section numbers start below 30, which keeps table rows such as "91.3 Huang & Harper" out
+NUMBERED_HEADING = re.compile(r"^(?:[12]?\d(?:\.\d+)*\.?|[A-Z]\.\d+(?:\.\d+)*|[IVX]+\.)\s+[A-Z][^.:;\[]{1,80}$")
+SECTION_NUMBER = re.compile(r"^(?:\d+(?:\.\d+)*\.?|[A-Z]\.\d+(?:\.\d+)*|[IVX]+\.)$")
+SENTENCE_END = re.compile(r"[.!?][\"')\]]*\s+")
+# Chunks shorter than this are stray page numbers or footnote markers
+MIN_CHUNK_CHARS = 16
+
+def is_heading(line):
+    """Heuristically detects section headings: numbered titles, well-known section names or short all-caps lines."""
+    line = line.strip()
+    if not line or len(line) > 90 or len(line.split()) > 10 or "|" in line or "[" in line:
+        return False  # Too long, a Markdown table row, or cites a reference
+    bare = re.sub(r"^(?:\d+(?:\.\d+)*\.?|[IVX]+\.)\s*", "", line).strip().lower()
+    if bare in SECTION_NAMES:
+        return True
+    if NUMBERED_HEADING.match(line):
+        return True
+    letters = [c for c in line if c.isalpha()]
+    # Single all-caps words or codes are usually table cells ("BLEU", "WSJ 23 F1"), not headings
+    words = [word for word in line.split() if word.isalpha()]
+    return len(letters) >= 4 and all(c.isupper() for c in letters) and len(words) >= 2 and len(line.split()) <= 8
+
+def split_blocks(text):
+    """
+    Splits page text into heading and paragraph blocks of (kind, start, end) character offsets.
+
+    Paragraphs end at blank lines, at headings, and after a short line that
+    finishes a sentence (the usual last line of a PDF paragraph).
+    """
+    lines = []
+    offset = 0
+    for line in text.splitlines(keepends=True):
+        start, end, stripped = offset, offset + len(line.rstrip("\r\n")), line.strip()
+        offset += len(line)
+        # PyMuPDF often puts a heading's number ("3.2") on its own line; rejoin it with the title
+        if lines and SECTION_NUMBER.match(lines[-1][2]) and is_heading(f"{lines[-1][2]} {stripped}"):
+            previous_start = lines.pop()[0]
+            start, stripped = previous_start, f"{text[previous_start:start].strip()} {stripped}"
+        lines.append((start, end, stripped))
+    widths = sorted(len(stripped) for _, _, stripped in lines if stripped)
+    typical_width = widths[int(len(widths) * 0.75)] if widths else 0
+
+    blocks = []
+    paragraph_start = None
+    paragraph_end = None
+    for start, end, stripped in lines:
+        if not stripped or is_heading(stripped):
+            if paragraph_start is not None:
+                blocks.append(("paragraph", paragraph_start, paragraph_end))
+                paragraph_start = None
+            if stripped:
+                blocks.append(("heading", start, end))
+            continue
+        if paragraph_start is None:
+            paragraph_start = start
+        paragraph_end = end
+        if stripped[-1] in ".!?:" and len(stripped) < 0.6 * typical_width:
+            blocks.append(("paragraph", paragraph_start, paragraph_end))
+            paragraph_start = None
+    if paragraph_start is not None:
+        blocks.append(("paragraph", paragraph_start, paragraph_end))
+    return blocks
+
+def split_sentences(text, start, end):
+    """Splits text[start:end] into sentence spans, without breaking after abbreviations like "et al." or "Fig."."""
+    spans = []
+    sentence_start = start
+    for match in SENTENCE_END.finditer(text, start, end):
+        words_before = text[sentence_start:match.start()].split()
+        previous_word = words_before[-1].lstrip("([\"'").lower() if words_before else ""
+        next_char = text[match.end()] if match.end() < end else ""
+        if previous_word in ABBREVIATIONS or len(previous_word) == 1 and previous_word.isalpha():
+            continue  # "et al.", "Fig.", initials such as "A. Vaswani"
+        if next_char and next_char.islower():
+            continue
+        spans.append((sentence_start, match.start() + 1))
+        sentence_start = match.end()
+    if sentence_start < end and text[sentence_start:end].strip():
+        spans.append((sentence_start, end))
+    return spans
+
+def _split_long_span(text, start, end, max_tokens, count_tokens):
+    """Splits a span longer than max_tokens into word windows that each fit."""
+    words = [(m.start(), m.end()) for m in re.finditer(r"\S+", text[start:end])]
+    spans = []
+    window_start = 0
+    while window_start < len(words):
+        window_end = window_start + 1
+        while (window_end < len(words) and
+               count_tokens(text[start + words[window_start][0]:start + words[window_end][1]]) <= max_tokens):
+            window_end += 1
+        spans.append((start + words[window_start][0], start + words[window_end - 1][1]))
+        window_start = window_end
+    return spans
+
+@register_chunker("structure")
+def structure_chunker(text, page_number, section="", max_tokens=200, overlap_tokens=32, count_tokens=approximate_token_count):
+    """
+    Packs whole sentences into chunks of at most max_tokens model tokens,
+    never crossing a section heading and preferring paragraph boundaries.
+    Consecutive chunks in a section share up to overlap_tokens of trailing sentences.
+    """
+    chunks = []
+    current = []  # (start, end, tokens) of sentences in the chunk being built
+
+    def emit():
+        if current:
+            chunk_start, chunk_end = current[0][0], current[-1][1]
+            chunk_text = normalize_chunk_text(text[chunk_start:chunk_end])
+            if len(chunk_text) >= MIN_CHUNK_CHARS and (not chunks or chunks[-1]["char_end"] < chunk_end):
+                chunks.append({"text": chunk_text, "page": page_number, "section": section,
+                               "char_start": chunk_start, "char_end": chunk_end})
+
+    def carry_overlap():
+        overlap = []
+        total = 0
+        for sentence in reversed(current):
+            if total + sentence[2] > overlap_tokens:
+                break
+            overlap.insert(0, sentence)
+            total += sentence[2]
+        return overlap
+
+    for kind, start, end in split_blocks(text):
+        if kind == "heading":
+            emit()
+            current = []
+            section = normalize_chunk_text(text[start:end])
+            continue
+
+        for sentence_start, sentence_end in split_sentences(text, start, end):
+            tokens = count_tokens(text[sentence_start:sentence_end])
+            pieces = ([(sentence_start, sentence_end, tokens)] if tokens <= max_tokens else
+                      [(s, e, count_tokens(text[s:e])) for s, e in
+                       _split_long_span(text, sentence_start, sentence_end, max_tokens, count_tokens)])
+            for piece in pieces:
+                if current and sum(s[2] for s in current) + piece[2] > max_tokens:
+                    emit()
+                    current = carry_overlap()
+                    while current and sum(s[2] for s in current) + piece[2] > max_tokens:
+                        current.pop(0)
+                current.append(piece)
+
+        # Close the chunk at a paragraph boundary once it is reasonably full
+        if current and sum(s[2] for s in current) >= max_tokens // 2:
+            emit()
+            current = carry_overlap()
+
+    emit()
+    return chunks, section
+
+@register_chunker("sentence")
+def sentence_chunker(text, page_number, section="", max_tokens=200, overlap_tokens=0, count_tokens=approximate_token_count):
+    """Legacy chunker: splits flattened text on ". " into chunks of roughly 1000 characters."""
+    flattened = normalize_chunk_text(text)
+    chunks = []
+    current_chunk = []
+    current_length = 0
+    cursor = 0
+    for sentence in flattened.split(". "):
+        sentence = sentence.strip()
+        if not sentence:
+            continue
+        if not sentence.endswith('.'):
+            sentence += '.'
+        if current_length + len(sentence) > 1000 and current_chunk:
+            chunks.append(" ".join(current_chunk))
+            current_chunk = []
+            current_length = 0
+        current_chunk.append(sentence)
+        current_length += len(sentence)
+    if current_chunk:
+        chunks.append(" ".join(current_chunk))
+
+    results = []
+    for chunk in chunks:
+        # Spans refer to the flattened text, since this chunker discards the page layout
+        start = flattened.find(chunk.rstrip("."), cursor)
+        end = start + len(chunk.rstrip(".")) if start >= 0 else -1
+        cursor = max(cursor, end)
+        results.append({"text": chunk, "page": page_number, "section": section, "char_start": start, "char_end": end})
+    return results, section
+
+def chunk_page(text, page_number, section="", strategy="structure", max_tokens=200, overlap_tokens=32, count_tokens=None):
+    """
+    Chunks one page of text with the named strategy.
+
+    Args:
+        text (str): Raw page text, with line breaks preserved.
+        page_number (int): 1-based page number recorded on each chunk.
+        section (str): Section heading in effect at the start of the page.
+        strategy (str): Registered chunker name, e.g. "structure" or "sentence".
+        max_tokens (int): Maximum tokens per chunk.
+        overlap_tokens (int): Tokens of trailing context repeated in the next chunk.
+        count_tokens (callable): Counts tokens in a string; defaults to an estimate.
+
+    Returns:
+        tuple: (list of chunk dicts, section in effect at the end of the page)
+    """
+    if strategy not in CHUNKERS:
+        raise ValueError(f"Unknown chunker: {strategy}. Expected one of {sorted(CHUNKERS)}")
+    if not text or not text.strip():
+        return [], section
+    return CHUNKERS[strategy](text, page_number, section, max_tokens, overlap_tokens,
+                              count_tokens or approximate_token_count)
@@ -0,0 +1,170 @@
+import hashlib
+import os
+import re
+import threading
+from contextlib import contextmanager
+import numpy as np
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+# Disk-backed cache of embeddings keyed by (model id, text hash).
+#
+# Each model/dimension pair is stored as one append-only shard pair:
+#   <model>_<dim>.keys  - 16-byte text digests, one per row
+#   <model>_<dim>.f32   - raw float32 vectors, memory-mapped on read
+# Writers from every process append under an exclusive lock on
+# <model>_<dim>.lock, so parallel ingestion workers never interleave rows and
+# readers only ever stat and map two files.
+
+project_dir = os.path.dirname(os.path.abspath(__file__))
+embedding_cache_dir = os.path.join(project_dir, "embedding_cache")
+os.makedirs(embedding_cache_dir, exist_ok=True)
+
+KEY_BYTES = 16
+
+embedding_cache_stats = {"hits": 0, "misses": 0}
+_cache_lock = threading.Lock()
+_key_index = {}    # digest -> (vectors shard path, row)
+_shard_rows = {}   # vectors shard path -> rows already indexed
+_memmaps = {}      # vectors shard path -> (rows mapped, memmap)
+
+def _cache_prefix(model_id, dimension):
+    """Returns the shard path prefix for a model id and embedding dimension."""
+    slug = re.sub(r"[^A-Za-z0-9]+", "_", model_id).strip("_")
+    return os.path.join(embedding_cache_dir, f"{slug}_{dimension}")
+
+def _text_digest(model_id, text):
+    """Hashes a text together with the model id that embeds it."""
+    return hashlib.blake2b(f"{model_id}\0{text}".encode("utf-8"), digest_size=KEY_BYTES).digest()
+
+@contextmanager
+def _shard_write_lock(prefix):
+    """Holds an exclusive lock on a shard across processes while it is written."""
+    with open(f"{prefix}.lock", "a+b") as lock_file:
+        if fcntl is not None:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+        else:
+            lock_file.seek(0)
+            msvcrt.locking(lock_file.fileno(), msvcrt.LK_LOCK, 1)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+            else:
+                lock_file.seek(0)
+                msvcrt.locking(lock_file.fileno(), msvcrt.LK_UNLCK, 1)
+
+def _aligned_rows(keys_path, vectors_path, dimension):
+    """Number of complete rows present in both files of a shard."""
+    if not os.path.exists(keys_path) or not os.path.exists(vectors_path):
+        return 0
+    return min(os.path.getsize(keys_path) // KEY_BYTES, os.path.getsize(vectors_path) // (4 * dimension))
+
+def _truncate_shard(prefix, dimension):
+    """
+    Cuts both files of a shard back to their common row count and returns it.
+
+    A crash between the vector and key appends leaves one file longer than the
+    other; without this the next append would pair keys with the wrong vectors.
+    Must be called with the shard write lock held.
+    """
+    keys_path, vectors_path = f"{prefix}.keys", f"{prefix}.f32"
+    rows = _aligned_rows(keys_path, vectors_path, dimension)
+    for path, row_bytes in [(keys_path, KEY_BYTES), (vectors_path, 4 * dimension)]:
+        if os.path.exists(path) and os.path.getsize(path) != rows * row_bytes:
+            os.truncate(path, rows * row_bytes)
+    return rows
+
+def _write_rows(prefix, digests, vector_bytes):
+    """Appends rows to a shard; vectors are written before their keys. Requires the write lock."""
+    with open(f"{prefix}.f32", "ab") as f:
+        f.write(vector_bytes)
+    with open(f"{prefix}.keys", "ab") as f:
+        f.write(b"".join(digests))
+
+def _refresh_shards(prefix, dimension):
+    """Indexes rows appended to the shard (by this or another process) since the last refresh."""
+    keys_path, vectors_path = f"{prefix}.keys", f"{prefix}.f32"
+    # A torn append in progress can leave one file longer; trust the shorter
+    rows = _aligned_rows(keys_path, vectors_path, dimension)
+    known_rows = _shard_rows.get(vectors_path, 0)
+    if rows <= known_rows:
+        return
+    with open(keys_path, "rb") as f:
+        f.seek(known_rows * KEY_BYTES)
+        keys = f.read((rows - known_rows) * KEY_BYTES)
+    for i in range(rows - known_rows):
+        _key_index.setdefault(keys[i * KEY_BYTES:(i + 1) * KEY_BYTES], (vectors_path, known_rows + i))
+    _shard_rows[vectors_path] = rows
+
+def _read_vector(vectors_path, row, dimension):
+    """Reads one cached vector through a memory map, remapping the shard when it has grown."""
+    rows = _shard_rows[vectors_path]
+    mapped = _memmaps.get(vectors_path)
+    if mapped is None or mapped[0] < rows:
+        mapped = (rows, np.memmap(vectors_path, dtype="float32", mode="r", shape=(rows, dimension)))
+        _memmaps[vectors_path] = mapped
+    return mapped[1][row]
+
+def _append_vectors(prefix, digests, vectors, dimension):
+    """Appends vectors to the shard under the cross-process lock, first dropping any torn tail rows."""
+    with _shard_write_lock(prefix):
+        _truncate_shard(prefix, dimension)
+        _write_rows(prefix, digests, np.ascontiguousarray(vectors, dtype="float32").tobytes())
+
+def encode_with_cache(texts, encode_fn, model_id, dimension):
+    """
+    Returns float32 embeddings for texts, encoding only those not already cached.
+
+    Args:
+        texts (list): Texts to embed.
+        encode_fn (callable): Encodes a list of texts into an array of vectors.
+        model_id (str): Identifies the model and settings that produced the vectors.
+        dimension (int): Embedding dimension.
+
+    Returns:
+        np.ndarray: One row per text, or None if encoding the misses failed.
+    """
+    prefix = _cache_prefix(model_id, dimension)
+    digests = [_text_digest(model_id, text) for text in texts]
+    embeddings = np.empty((len(texts), dimension), dtype="float32")
+
+    missing = {}  # digest -> positions of texts needing it
+    with _cache_lock:
+        _refresh_shards(prefix, dimension)
+        for position, digest in enumerate(digests):
+            location = _key_index.get(digest)
+            if location is not None:
+                embeddings[position] = _read_vector(*location, dimension)
+            else:
+                missing.setdefault(digest, []).append(position)
+        embedding_cache_stats["hits"] += len(texts) - sum(len(p) for p in missing.values())
+        embedding_cache_stats["misses"] += sum(len(p) for p in missing.values())
+
+    if not missing:
+        return embeddings
+
+    missing_digests = list(missing)
+    vectors = encode_fn([texts[missing[digest][0]] for digest in missing_digests])
+    if vectors is None:
+        return None
+    vectors = np.asarray(vectors, dtype="float32").reshape(len(missing_digests), dimension)
+    for digest, vector in zip(missing_digests, vectors):
+        embeddings[missing[digest]] = vector
+
+    with _cache_lock:
+        try:
+            _append_vectors(prefix, missing_digests, vectors, dimension)
+            _refresh_shards(prefix, dimension)
+        except OSError as e:
+            print(f"[WARNING] Could not write embedding cache: {e}")
+    return embeddings
+
+def get_embedding_cache_stats():
+    """Returns hit/miss counters and the number of cached vectors known to this process."""
+    with _cache_lock:
+        return {**embedding_cache_stats, "entries": len(_key_index)}
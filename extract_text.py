@@ -5,9 +5,25 @@ import os
 import pytesseract
 from PIL import Image
 import shutil
+import hashlib
+import io
+import threading
+import math
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from functools import lru_cache
+from utils import get_pdf_content_hash, OCR_WORKERS, INGEST_WORKERS
 
+# Images below either bound are rules, bullets or logos not worth running OCR on
+MIN_OCR_IMAGE_SIDE = 32
+MIN_OCR_IMAGE_PIXELS = 96 * 96
+
+ocr_cache_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "ocr_cache")
+ocr_stats = {"cache_hits": 0, "ocr_runs": 0, "skipped": 0, "duplicates": 0}
+
+@lru_cache(maxsize=None)
 def _is_tesseract_available():
-    """Return True if Tesseract OCR binary is available on PATH."""
+    """Return True if Tesseract OCR binary is available on PATH. Checked once per process."""
     try:
         # pytesseract will raise if not available; shutil.which is fast precheck
         if shutil.which("tesseract") is None:
@@ -18,97 +34,443 @@ def _is_tesseract_available():
     except Exception:
         return False
 
-def extract_text_from_images(image_paths):
-    """Extracts text from images using OCR. If Tesseract is unavailable, returns []."""
-    if not image_paths:
+def _ocr_cache_path(image_hash):
+    """Returns the cache file for an image hash, sharded by its first two hex digits."""
+    return os.path.join(ocr_cache_dir, image_hash[:2], f"{image_hash}.txt")
+
+def _read_ocr_cache(image_hash):
+    """Returns cached OCR text for an image hash, or None if it was never OCR'd."""
+    try:
+        with open(_ocr_cache_path(image_hash), "r", encoding="utf-8") as f:
+            return f.read()
+    except OSError:
+        return None
+
+def _write_ocr_cache(image_hash, text):
+    """Caches OCR text (possibly empty) for an image hash; writes are atomic so workers can share the cache."""
+    cache_path = _ocr_cache_path(image_hash)
+    try:
+        os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+        tmp_path = f"{cache_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(text)
+        os.replace(tmp_path, cache_path)
+    except OSError as e:
+        print(f"[WARNING] Could not write OCR cache: {e}")
+
+def _is_too_small_for_ocr(image_bytes):
+    """Reads only the image header to reject tiny or decorative images."""
+    try:
+        with Image.open(io.BytesIO(image_bytes)) as image:
+            width, height = image.size
+    except Exception:
+        return True  # Not an image format PIL can read, so Tesseract cannot either
+    return min(width, height) < MIN_OCR_IMAGE_SIDE or width * height < MIN_OCR_IMAGE_PIXELS
+
+def _run_ocr(image_bytes):
+    """Pool worker: runs Tesseract on one image."""
+    with Image.open(io.BytesIO(image_bytes)) as image:
+        return pytesseract.image_to_string(image) or ""
+
+def ocr_images(images, workers=OCR_WORKERS):
+    """
+    Runs OCR over image bytes, doing the work once per distinct image.
+
+    Identical images (by SHA-256) are OCR'd once, tiny images are skipped,
+    text is served from an on-disk cache shared across papers, and the
+    remaining images are OCR'd by a pool of ``workers`` threads, each
+    driving its own Tesseract process.
+
+    Args:
+        images (list): Raw image bytes.
+        workers (int): Concurrent Tesseract processes.
+
+    Returns:
+        list: One OCR text per input image ("" if skipped, failed or blank);
+        repeated images get the text of their first occurrence.
+    """
+    if not images:
         return []
     if not _is_tesseract_available():
         print("[INFO] Tesseract not found on PATH. Skipping image OCR.")
+        return [""] * len(images)
+
+    hashes = [hashlib.sha256(image_bytes).hexdigest() for image_bytes in images]
+    texts_by_hash = {}
+    pending = {}  # hash -> image bytes still needing OCR
+    for image_hash, image_bytes in zip(hashes, images):
+        if image_hash in texts_by_hash or image_hash in pending:
+            ocr_stats["duplicates"] += 1
+            continue
+        if _is_too_small_for_ocr(image_bytes):
+            ocr_stats["skipped"] += 1
+            texts_by_hash[image_hash] = ""
+            continue
+        cached_text = _read_ocr_cache(image_hash)
+        if cached_text is not None:
+            ocr_stats["cache_hits"] += 1
+            texts_by_hash[image_hash] = cached_text
+        else:
+            pending[image_hash] = image_bytes
+
+    if pending:
+        if workers > 1:
+            # Tesseract's own OpenMP threads would oversubscribe the CPU next to the pool
+            os.environ.setdefault("OMP_THREAD_LIMIT", "1")
+        with ThreadPoolExecutor(max_workers=max(1, min(workers, len(pending)))) as executor:
+            futures = {executor.submit(_run_ocr, image_bytes): image_hash for image_hash, image_bytes in pending.items()}
+            for future, image_hash in futures.items():
+                try:
+                    texts_by_hash[image_hash] = future.result()
+                    ocr_stats["ocr_runs"] += 1
+                    _write_ocr_cache(image_hash, texts_by_hash[image_hash])
+                except Exception as e:
+                    # Log a single-line notice per image without long traceback noise; not cached so it is retried
+                    print(f"[WARNING] OCR failed for image {image_hash[:12]}: {e}")
+                    texts_by_hash[image_hash] = ""
+    print(f"[DEBUG] OCR: {len(images)} images, {len(pending)} OCR'd, "
+          f"{len(texts_by_hash) - len(pending)} cached or skipped")
+    return [texts_by_hash[image_hash] for image_hash in hashes]
+
+def extract_text_from_images(image_paths, workers=OCR_WORKERS):
+    """Extracts text from images using OCR, once per distinct image. If Tesseract is unavailable, returns []."""
+    if not image_paths:
         return []
-    extracted_texts = []
+    images = []
     for image_path in image_paths:
         try:
-            image = Image.open(image_path)
-            text = pytesseract.image_to_string(image)
-            if text:
-                extracted_texts.append(text)
-        except Exception as e:
-            # Log a single-line notice per image without long traceback noise
-            print(f"[WARNING] OCR failed for {image_path}: {e}")
+            with open(image_path, "rb") as f:
+                images.append(f.read())
+        except OSError as e:
+            print(f"[WARNING] Could not read image {image_path}: {e}")
+    extracted_texts = []
+    for text in ocr_images(images, workers):
+        if text and text not in extracted_texts:
+            extracted_texts.append(text)
     return extracted_texts
 
-def extract_tables_from_pdf(pdf_path, page_number):
-    """Extracts tables from a specific page using pdfplumber and parses them into structured data."""
+# Tables wider than this, or mostly empty, are figures that pdfplumber mistook for a grid
+MAX_TABLE_COLUMNS = 20
+MIN_FILLED_CELL_FRACTION = 0.3
+# Largest gap (in points) between a table and the caption that labels it
+MAX_CAPTION_GAP = 40
+# A text line at least this long below an unruled table's caption marks the end of the table
+MIN_PARAGRAPH_LINE_CHARS = 70
+TABLE_CAPTION = re.compile(r"^\s*Table\s+([0-9]+|[IVX]+)\s*[:.]", re.IGNORECASE)
+TEXT_TABLE_SETTINGS = {"vertical_strategy": "text", "horizontal_strategy": "text"}
+
+def format_table_markdown(table):
+    """Formats a table dict (``caption`` and ``rows``) as a Markdown table under its caption."""
+    lines = [table["caption"]] if table.get("caption") else []
+    rows = table.get("rows") or []
+    if rows:
+        lines.append("| " + " | ".join(rows[0]) + " |")
+        lines.append("|" + "---|" * len(rows[0]))
+        lines.extend("| " + " | ".join(row) + " |" for row in rows[1:])
+    return "\n".join(lines)
+
+def _clean_table_rows(rows):
+    """Normalises cells to single-line strings and drops empty rows and columns."""
+    rows = [[re.sub(r"\s+", " ", str(cell)).strip() if cell is not None else "" for cell in row] for row in rows or []]
+    rows = [row for row in rows if any(row)]
+    if not rows:
+        return []
+    width = max(len(row) for row in rows)
+    rows = [row + [""] * (width - len(row)) for row in rows]
+    filled_columns = [column for column in range(width) if any(row[column] for row in rows)]
+    return [[row[column] for column in filled_columns] for row in rows]
+
+def _looks_like_table(rows):
+    """Rejects detections that are too small, too wide or too sparse to be a real table."""
+    if len(rows) < 2 or not 2 <= len(rows[0]) <= MAX_TABLE_COLUMNS:
+        return False
+    cells = [cell for row in rows for cell in row]
+    return sum(1 for cell in cells if cell) >= MIN_FILLED_CELL_FRACTION * len(cells)
+
+def _find_table_captions(page):
+    """Returns (table number, caption text, bbox) for each "Table N:" caption block on a PyMuPDF page."""
+    captions = []
+    for x0, y0, x1, y1, text, *_ in page.get_text("blocks"):
+        match = TABLE_CAPTION.match(text)
+        if match:
+            captions.append((match.group(1), re.sub(r"\s+", " ", text).strip(), (x0, y0, x1, y1)))
+    return captions
+
+def _table_region_below(page, caption_bbox):
+    """Bounds an unruled table as the blocks between its caption and the next paragraph of body text."""
+    bottom = None
+    for x0, y0, x1, y1, text, *_ in sorted(page.get_text("blocks"), key=lambda block: block[1]):
+        if y0 < caption_bbox[3]:
+            continue
+        if max((len(line) for line in text.splitlines()), default=0) >= MIN_PARAGRAPH_LINE_CHARS:
+            break
+        bottom = y1
+    if bottom is None:
+        return None
+    return (caption_bbox[0], caption_bbox[3], caption_bbox[2], bottom)
+
+def extract_page_tables(page, table_page):
+    """
+    Extracts every table on a page, with its caption when one can be matched.
+
+    Ruled tables come from pdfplumber's line-based detection. Captions
+    ("Table N: ...") are read with PyMuPDF and attached to the nearest table;
+    a caption with no ruled table beneath it (booktabs-style tables) is
+    matched to the region below it, which is parsed with text alignment.
+
+    Args:
+        page: The PyMuPDF page.
+        table_page: The same page opened with pdfplumber.
+
+    Returns:
+        list: Dicts with ``index``, ``number`` (the caption's table number or
+        None), ``caption``, ``header`` (the first row) and ``rows``.
+    """
     tables = []
+    for found in table_page.find_tables():
+        rows = _clean_table_rows(found.extract())
+        if _looks_like_table(rows):
+            tables.append({"bbox": found.bbox, "number": None, "caption": "", "rows": rows})
+
+    for number, caption, caption_bbox in _find_table_captions(page):
+        def gap(table):
+            return max(table["bbox"][1] - caption_bbox[3], caption_bbox[1] - table["bbox"][3], 0)
+        candidates = [table for table in tables if not table["caption"] and gap(table) <= MAX_CAPTION_GAP]
+        if candidates:
+            table = min(candidates, key=gap)
+            table["number"], table["caption"] = number, caption
+            continue
+        region = _table_region_below(page, caption_bbox)
+        if region is None:
+            continue
+        try:
+            rows = _clean_table_rows(table_page.crop(region).extract_table(TEXT_TABLE_SETTINGS))
+        except Exception as e:
+            print(f"[WARNING] Could not parse table under caption '{caption[:40]}': {e}")
+            rows = []
+        # Keep the caption even when the body cannot be parsed, so the table can still be found
+        tables.append({"bbox": region, "number": number, "caption": caption,
+                       "rows": rows if _looks_like_table(rows) else []})
+
+    tables.sort(key=lambda table: (table["bbox"][1], table["bbox"][0]))
+    return [{"index": index, "number": table["number"], "caption": table["caption"],
+             "header": table["rows"][0] if table["rows"] else [], "rows": table["rows"]}
+            for index, table in enumerate(tables)]
+
+def extract_tables_from_pdf(pdf_path, page_number):
+    """Extracts all tables from a specific page (0-based) and returns them as Markdown."""
+    table_text = ""
     try:
-        with pdfplumber.open(pdf_path) as pdf:
+        with fitz.open(pdf_path) as doc, pdfplumber.open(pdf_path) as pdf:
             if page_number < len(pdf.pages):
-                table_page = pdf.pages[page_number]
-                extracted_tables = table_page.extract_table()
-                if extracted_tables:
-                    for row in extracted_tables:
-                        tables.append(" | ".join(str(cell) if cell else "" for cell in row))
+                tables = extract_page_tables(doc[page_number], pdf.pages[page_number])
+                table_text = "\n\n".join(format_table_markdown(table) for table in tables)
     except Exception as e:
         print(f"Error extracting tables from {pdf_path}: {e}")
 
-    return "\n".join(tables) if tables else ""  # Convert tables to a readable format
+    return table_text  # Convert tables to a readable format
 
-def extract_text_from_pdf(pdf_path):
-    """Extracts clean text and tables from a given PDF file."""
-    print(f"[DEBUG] Starting PDF extraction from: {pdf_path}")
-    
+def get_pdf_page_count(pdf_path):
+    """Returns the number of pages in a PDF, or 0 if it cannot be opened."""
+    try:
+        with fitz.open(pdf_path) as doc:
+            return len(doc)
+    except Exception as e:
+        print(f"[ERROR] Could not open PDF {pdf_path}: {e}")
+        return 0
+
+def _page_fingerprint(doc, page):
+    """Hashes a page's content stream and raw image streams to detect changed pages cheaply."""
+    digest = hashlib.sha256(page.read_contents())
+    for xref in sorted({img[0] for img in page.get_images(full=True)}):
+        digest.update(doc.xref_stream_raw(xref) or b"")
+    return digest.hexdigest()
+
+def get_page_fingerprints(pdf_path):
+    """Returns one content fingerprint per page without extracting text, tables or images."""
+    try:
+        with fitz.open(pdf_path) as doc:
+            return [_page_fingerprint(doc, page) for page in doc]
+    except Exception as e:
+        print(f"[ERROR] Could not fingerprint PDF {pdf_path}: {e}")
+        return []
+
+def extract_pages_from_pdf(pdf_path, include_tables=True, include_images=True, page_range=None, pages=None):
+    """
+    Extracts text, tables and images page by page in a single pass over the PDF.
+
+    PyMuPDF and pdfplumber each open the document exactly once; pages are
+    yielded as they are processed so callers can stream large documents.
+
+    Args:
+        pdf_path (str): The file path to the PDF.
+        include_tables (bool): Whether to run pdfplumber table extraction.
+        include_images (bool): Whether to extract embedded image bytes.
+        page_range (tuple): Optional 0-based ``(start, stop)`` range of pages
+            to extract; defaults to the whole document.
+        pages (iterable): Optional 0-based page indices to extract instead
+            of a contiguous range.
+
+    Yields:
+        dict: A page record with keys ``page_number`` (1-based), ``fingerprint``,
+        ``text``, ``tables`` (see ``extract_page_tables``), ``table_text`` (the
+        tables as Markdown) and ``images`` (a list of dicts
+        with ``index``, ``xref``, ``ext`` and raw ``image`` bytes). Images stay
+        in memory; use ``save_page_images`` to persist them.
+    """
     if not os.path.exists(pdf_path):
         print(f"[ERROR] PDF file not found at {pdf_path}")
-        return ""
-        
+        return
+
+    doc = None
+    plumber_pdf = None
     try:
-        print("[DEBUG] Opening PDF with PyMuPDF...")
-        doc = fitz.open(pdf_path)  # Open the PDF
-        if doc is None:
-            print(f"[ERROR] Could not open PDF {pdf_path}")
-            return ""
-            
-        extracted_text = []
+        doc = fitz.open(pdf_path)
         print(f"[DEBUG] PDF has {len(doc)} pages")
+        if include_tables:
+            try:
+                plumber_pdf = pdfplumber.open(pdf_path)
+            except Exception as e:
+                print(f"[WARNING] Could not open {pdf_path} with pdfplumber, skipping tables: {e}")
+
+        if pages is not None:
+            page_indices = sorted(index for index in set(pages) if 0 <= index < len(doc))
+        else:
+            start, stop = page_range if page_range else (0, len(doc))
+            page_indices = range(max(start, 0), min(stop, len(doc)))
+        images_by_xref = {}  # Images reused across pages (logos, headers) are decoded once
+        for page_index in page_indices:
+            page = doc[page_index]
+            record = {
+                "page_number": page_index + 1,
+                "fingerprint": _page_fingerprint(doc, page),
+                "text": "",
+                "tables": [],
+                "table_text": "",
+                "images": [],
+            }
 
-        for page_num, page in enumerate(doc):
-            print(f"[DEBUG] Processing page {page_num + 1}")
-            # Extract plain text
             try:
-                page_text = page.get_text("text")
-                print(f"[DEBUG] Page {page_num + 1} text type: {type(page_text)}, length: {len(page_text) if page_text else 0}")
-                
-                if page_text:
-                    extracted_text.append(page_text)
-                    
-                # Extract tables (using pdfplumber)
-                table_text = extract_tables_from_pdf(pdf_path, page_num)
-                if table_text:
-                    print(f"[DEBUG] Found table text on page {page_num + 1}")
-                    extracted_text.append(table_text)
+                record["text"] = page.get_text("text") or ""
             except Exception as e:
-                print(f"[ERROR] Failed extracting text from page {page_num + 1}: {e}")
-                continue
+                print(f"[ERROR] Failed extracting text from page {page_index + 1}: {e}")
 
-        doc.close()
-        print("[DEBUG] PDF document closed")
-        
-        # Join all extracted text
-        final_text = "\n".join(text for text in extracted_text if text and isinstance(text, str))
-        print(f"[DEBUG] Final text length before cleaning: {len(final_text)}")
-        
-        if not final_text:
-            print("[WARNING] No text was extracted from the PDF")
-            return ""
-            
-        cleaned_text = clean_text(final_text)
-        print(f"[DEBUG] Text length after cleaning: {len(cleaned_text)}")
-        return cleaned_text
-        
+            if plumber_pdf is not None and page_index < len(plumber_pdf.pages):
+                table_page = plumber_pdf.pages[page_index]
+                try:
+                    record["tables"] = extract_page_tables(page, table_page)
+                    record["table_text"] = "\n\n".join(format_table_markdown(table) for table in record["tables"])
+                except Exception as e:
+                    print(f"[WARNING] Failed extracting tables from page {page_index + 1}: {e}")
+                finally:
+                    # Release pdfplumber's per-page object cache as we stream
+                    table_page.close()
+
+            for img_index, img in enumerate(page.get_images(full=True) if include_images else []):
+                xref = img[0]
+                if xref not in images_by_xref:
+                    try:
+                        images_by_xref[xref] = doc.extract_image(xref)
+                    except Exception as e:
+                        print(f"[WARNING] Failed extracting image {xref} from page {page_index + 1}: {e}")
+                        images_by_xref[xref] = None
+                image = images_by_xref[xref]
+                if image and image.get("image"):
+                    record["images"].append({
+                        "index": img_index,
+                        "xref": xref,
+                        "ext": image.get("ext", "png"),
+                        "image": image["image"],
+                    })
+
+            yield record
     except Exception as e:
         print(f"[ERROR] Failed processing PDF {pdf_path}: {e}")
+    finally:
+        if plumber_pdf is not None:
+            plumber_pdf.close()
+        if doc is not None:
+            doc.close()
+
+# Smallest page shard worth sending to a separate process
+MIN_PAGES_PER_SHARD = 8
+
+def _extract_page_range(pdf_path, start, stop):
+    """Pool worker: extracts the page records of one contiguous page range."""
+    return list(extract_pages_from_pdf(pdf_path, page_range=(start, stop)))
+
+def extract_pages_parallel(pdf_path, workers=INGEST_WORKERS):
+    """
+    Extracts page records by sharding page ranges of a PDF across a process pool.
+
+    Shards are merged back in page order, so the result is identical to a
+    sequential pass over ``extract_pages_from_pdf``. The pool worker lives in
+    this module, which does not import torch, so spawned processes start quickly.
+    """
+    page_count = get_pdf_page_count(pdf_path)
+    shard_size = max(MIN_PAGES_PER_SHARD, math.ceil(page_count / max(workers, 1)))
+    shards = [(start, min(start + shard_size, page_count)) for start in range(0, page_count, shard_size)]
+    if len(shards) <= 1:
+        return list(extract_pages_from_pdf(pdf_path))
+
+    print(f"[DEBUG] Extracting {page_count} pages in {len(shards)} shards across {workers} workers")
+    pages = []
+    with ProcessPoolExecutor(max_workers=min(workers, len(shards)),
+                             mp_context=multiprocessing.get_context("spawn")) as executor:
+        futures = [executor.submit(_extract_page_range, pdf_path, start, stop) for start, stop in shards]
+        for future in futures:
+            pages.extend(future.result())
+    return sorted(pages, key=lambda page: page["page_number"])
+
+def save_page_images(page_record, output_folder="extracted_images", paper_id=None):
+    """
+    Writes the images of a page record to disk and returns their file paths.
+
+    Images are stored under ``output_folder/<paper_id>/`` and named by the
+    SHA-256 of their bytes with their real extension, so papers never
+    overwrite each other and an image already on disk is not written again.
+    """
+    if paper_id:
+        output_folder = os.path.join(output_folder, paper_id)
+    os.makedirs(output_folder, exist_ok=True)
+    image_paths = []
+    for image in page_record["images"]:
+        image_hash = hashlib.sha256(image["image"]).hexdigest()
+        img_filename = os.path.join(output_folder, f"{image_hash}.{image['ext']}")
+        try:
+            if not os.path.exists(img_filename):
+                with open(img_filename, "wb") as img_file:
+                    img_file.write(image["image"])
+            image_paths.append(img_filename)
+        except Exception as e:
+            print(f"[WARNING] Could not save image {img_filename}: {e}")
+    return image_paths
+
+def extract_text_from_pdf(pdf_path):
+    """Extracts clean text and tables from a given PDF file."""
+    print(f"[DEBUG] Starting PDF extraction from: {pdf_path}")
+
+    extracted_text = []
+    for page in extract_pages_from_pdf(pdf_path, include_images=False):
+        print(f"[DEBUG] Page {page['page_number']} text length: {len(page['text'])}")
+        if page["text"]:
+            extracted_text.append(page["text"])
+        if page["table_text"]:
+            print(f"[DEBUG] Found table text on page {page['page_number']}")
+            extracted_text.append(page["table_text"])
+
+    # Join all extracted text
+    final_text = "\n".join(text for text in extracted_text if text and isinstance(text, str))
+    print(f"[DEBUG] Final text length before cleaning: {len(final_text)}")
+
+    if not final_text:
+        print("[WARNING] No text was extracted from the PDF")
         return ""
 
+    cleaned_text = clean_text(final_text)
+    print(f"[DEBUG] Text length after cleaning: {len(cleaned_text)}")
+    return cleaned_text
+
 def extract_images_from_pdf(pdf_path, output_folder="extracted_images"):
     """
     Extracts images from a given PDF file and saves them as separate files.
@@ -118,25 +480,13 @@ def extract_images_from_pdf(pdf_path, output_folder="extracted_images"):
         output_folder (str): The directory where extracted images will be saved.
 
     Returns:
-        list: A list of file paths to the extracted images.
+        list: A list of file paths to the extracted images, under a
+        per-paper directory named by the PDF's content hash.
     """
-    os.makedirs(output_folder, exist_ok=True)
+    paper_id = get_pdf_content_hash(pdf_path)
     image_paths = []
-    try:
-        doc = fitz.open(pdf_path)
-        for page_num, page in enumerate(doc, start=1):
-            for img_index, img in enumerate(page.get_images(full=True)):
-                xref = img[0]
-                image = doc.extract_image(xref)
-                image_bytes = image["image"]
-                img_filename = f"{output_folder}/pdf_page_{page_num}_img_{img_index}.png"
-
-                with open(img_filename, "wb") as img_file:
-                    img_file.write(image_bytes)
-                    image_paths.append(img_filename)
-    except Exception as e:
-        print(f"Error extracting images from {pdf_path}: {e}")
-
+    for page in extract_pages_from_pdf(pdf_path, include_tables=False):
+        image_paths.extend(save_page_images(page, output_folder, paper_id))
     return image_paths  # Return list of extracted image paths
 
 def clean_text(text):
@@ -0,0 +1,286 @@
+import os
+import sqlite3
+import subprocess
+import sys
+import threading
+import time
+from utils import get_pdf_content_hash, is_pdf_processed, INGEST_WORKERS, GOOGLE_API_KEY
+
+# Background ingestion service.
+#
+# The Streamlit script only records jobs in a SQLite job table and polls their
+# status; a separate worker process (``python ingest_queue.py``) claims queued
+# jobs and runs process_pdf on them, writing per-stage progress back to the
+# table. Jobs are deduplicated by PDF content hash while queued or running, so
+# reruns and concurrent sessions uploading the same paper share one build.
+# When a Gemini key is configured, the worker also precomputes each finished
+# paper's section summaries, at low priority: only while no job is queued.
+
+project_dir = os.path.dirname(os.path.abspath(__file__))
+INGEST_DB_PATH = os.path.join(project_dir, "faiss_indexes", "ingest_jobs.sqlite3")
+
+# Share of a job's overall progress covered by each process_pdf stage
+STAGE_WEIGHTS = {
+    "queued": 0.0, "fingerprinting": 0.02, "extracting": 0.45, "ocr": 0.1, "tables": 0.03,
+    "embedding": 0.35, "saving": 0.05, "done": 0.0,
+}
+STAGE_ORDER = list(STAGE_WEIGHTS)
+# A running job whose worker has not touched it for this long is requeued
+JOB_STALE_SECONDS = 120
+HEARTBEAT_SECONDS = 5
+WORKER_POLL_SECONDS = 1.0
+# Workers exit after this long without jobs; the app starts a new one on demand
+WORKER_IDLE_EXIT_SECONDS = 300
+
+def _connect():
+    """Opens the job database, creating the schema on first use."""
+    os.makedirs(os.path.dirname(INGEST_DB_PATH), exist_ok=True)
+    connection = sqlite3.connect(INGEST_DB_PATH, timeout=30, isolation_level=None)
+    connection.row_factory = sqlite3.Row
+    connection.execute("PRAGMA journal_mode=WAL")
+    connection.executescript("""
+        CREATE TABLE IF NOT EXISTS jobs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            content_hash TEXT NOT NULL,
+            pdf_path TEXT NOT NULL,
+            name TEXT NOT NULL,
+            status TEXT NOT NULL,
+            stage TEXT NOT NULL,
+            progress REAL NOT NULL DEFAULT 0,
+            error TEXT,
+            worker_pid INTEGER,
+            created_at REAL NOT NULL,
+            updated_at REAL NOT NULL
+        );
+        -- At most one queued or running job per paper
+        CREATE UNIQUE INDEX IF NOT EXISTS jobs_in_flight ON jobs(content_hash)
+            WHERE status IN ('queued', 'running');
+        CREATE TABLE IF NOT EXISTS workers (
+            pid INTEGER PRIMARY KEY,
+            heartbeat REAL NOT NULL
+        );
+    """)
+    return connection
+
+def _overall_progress(stage, fraction):
+    """Converts a stage and the fraction of it done into overall job progress."""
+    done = sum(STAGE_WEIGHTS[name] for name in STAGE_ORDER[:STAGE_ORDER.index(stage)])
+    return min(done + STAGE_WEIGHTS[stage] * fraction, 1.0)
+
+def submit_job(pdf_path, name=None):
+    """
+    Queues a PDF for ingestion unless it is already processed or in flight.
+
+    Args:
+        pdf_path (str): Path to the PDF.
+        name (str): Display name, defaults to the file name.
+
+    Returns:
+        dict: The job record; an existing queued or running job for the same
+        content is returned instead of a new one, and a paper that is already
+        processed gets a job that is immediately "done".
+    """
+    content_hash = get_pdf_content_hash(pdf_path)
+    name = name or os.path.basename(pdf_path)
+    now = time.time()
+    status, stage, progress = ("done", "done", 1.0) if is_pdf_processed(pdf_path) else ("queued", "queued", 0.0)
+    connection = _connect()
+    try:
+        try:
+            cursor = connection.execute(
+                "INSERT INTO jobs (content_hash, pdf_path, name, status, stage, progress, created_at, updated_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (content_hash, os.path.abspath(pdf_path), name, status, stage, progress, now, now))
+            job_id = cursor.lastrowid
+        except sqlite3.IntegrityError:
+            # Another session already queued this paper
+            job_id = connection.execute(
+                "SELECT id FROM jobs WHERE content_hash = ? AND status IN ('queued', 'running')",
+                (content_hash,)).fetchone()["id"]
+            print(f"[DEBUG] Reusing in-flight ingestion job {job_id} for {name}")
+        return _get_job(connection, job_id)
+    finally:
+        connection.close()
+
+def _get_job(connection, job_id):
+    """Reads one job record as a dict, or None."""
+    row = connection.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+    return dict(row) if row else None
+
+def get_job(job_id):
+    """Returns a job record by id, or None."""
+    connection = _connect()
+    try:
+        return _get_job(connection, job_id)
+    finally:
+        connection.close()
+
+def get_jobs(job_ids):
+    """Returns the records of several jobs, keyed by id."""
+    if not job_ids:
+        return {}
+    connection = _connect()
+    try:
+        placeholders = ", ".join("?" * len(job_ids))
+        rows = connection.execute(f"SELECT * FROM jobs WHERE id IN ({placeholders})", list(job_ids)).fetchall()
+        return {row["id"]: dict(row) for row in rows}
+    finally:
+        connection.close()
+
+def _claim_next_job(connection):
+    """Atomically moves the oldest queued job to running and returns it, or None."""
+    connection.execute("BEGIN IMMEDIATE")
+    try:
+        row = connection.execute("SELECT id FROM jobs WHERE status = 'queued' ORDER BY id LIMIT 1").fetchone()
+        if row is None:
+            connection.execute("COMMIT")
+            return None
+        connection.execute("UPDATE jobs SET status = 'running', worker_pid = ?, updated_at = ? WHERE id = ?",
+                           (os.getpid(), time.time(), row["id"]))
+        connection.execute("COMMIT")
+        return _get_job(connection, row["id"])
+    except Exception:
+        connection.execute("ROLLBACK")
+        raise
+
+def _requeue_stale_jobs(connection):
+    """Requeues running jobs whose worker stopped updating them, e.g. after a crash."""
+    cursor = connection.execute(
+        "UPDATE jobs SET status = 'queued', stage = 'queued', progress = 0, worker_pid = NULL "
+        "WHERE status = 'running' AND updated_at < ?", (time.time() - JOB_STALE_SECONDS,))
+    if cursor.rowcount:
+        print(f"[WARNING] Requeued {cursor.rowcount} stale ingestion jobs")
+
+def _finish_job(connection, job_id, error=None):
+    """Marks a job done, or failed with its error message."""
+    status, stage = ("failed", "failed") if error else ("done", "done")
+    connection.execute("UPDATE jobs SET status = ?, stage = ?, progress = ?, error = ?, updated_at = ? WHERE id = ?",
+                       (status, stage, 0.0 if error else 1.0, error, time.time(), job_id))
+
+def _start_heartbeat(job_id=None):
+    """
+    Starts a thread that keeps this worker (and the given job, if any) looking
+    alive while long work runs. Returns a function that stops it.
+    """
+    stop_heartbeat = threading.Event()
+
+    def heartbeat():
+        heartbeat_connection = _connect()
+        try:
+            while not stop_heartbeat.wait(HEARTBEAT_SECONDS):
+                now = time.time()
+                if job_id is not None:
+                    heartbeat_connection.execute("UPDATE jobs SET updated_at = ? WHERE id = ?", (now, job_id))
+                heartbeat_connection.execute("INSERT OR REPLACE INTO workers (pid, heartbeat) VALUES (?, ?)",
+                                             (os.getpid(), now))
+        finally:
+            heartbeat_connection.close()
+
+    heartbeat_thread = threading.Thread(target=heartbeat, daemon=True)
+    heartbeat_thread.start()
+
+    def stop():
+        stop_heartbeat.set()
+        heartbeat_thread.join()
+    return stop
+
+def _run_job(job):
+    """
+    Runs process_pdf for a claimed job, recording stage progress and keeping the job alive.
+    Returns True if the paper was processed.
+    """
+    from main import process_pdf  # Imported lazily: loads torch and the embedding stack
+
+    connection = _connect()
+
+    def report_progress(stage, fraction):
+        if stage in STAGE_WEIGHTS:
+            connection.execute("UPDATE jobs SET stage = ?, progress = ?, updated_at = ? WHERE id = ?",
+                               (stage, _overall_progress(stage, fraction), time.time(), job["id"]))
+
+    # Long stages (embedding a large paper) report rarely; keep the job from looking stale
+    stop_heartbeat = _start_heartbeat(job["id"])
+    print(f"[DEBUG] Ingestion job {job['id']}: processing {job['name']}")
+    try:
+        process_pdf(job["pdf_path"], workers=INGEST_WORKERS, progress_callback=report_progress)
+        # process_pdf logs and returns on failure, so check for the artifacts it should have written
+        error = None if is_pdf_processed(job["pdf_path"]) else "Processing did not produce an index (see worker log)"
+    except Exception as e:
+        error = str(e)
+    finally:
+        stop_heartbeat()
+    _finish_job(connection, job["id"], error)
+    if error:
+        print(f"[ERROR] Ingestion job {job['id']} failed: {error}")
+    else:
+        print(f"[SUCCESS] Ingestion job {job['id']} done")
+    connection.close()
+    return error is None
+
+def _precompute_summaries(job):
+    """Summarises a processed paper's sections, so the first summary request only runs the reduce step."""
+    stop_heartbeat = _start_heartbeat()
+    try:
+        from summarizer import get_section_summaries  # Imported lazily: loads the QA stack
+        sections = get_section_summaries(job["pdf_path"])
+        print(f"[DEBUG] Precomputed {len(sections)} section summaries for {job['name']}")
+    except Exception as e:
+        print(f"[WARNING] Could not precompute section summaries for {job['name']}: {e}")
+    finally:
+        stop_heartbeat()
+
+def run_worker(idle_exit_seconds=WORKER_IDLE_EXIT_SECONDS):
+    """
+    Worker loop: claims and runs queued jobs until idle for idle_exit_seconds.
+    Section summaries of finished papers are precomputed only while no ingestion job is queued.
+    """
+    connection = _connect()
+    last_job_at = time.time()
+    pending_summaries = []  # Processed jobs whose section summaries are still to be precomputed
+    print(f"[DEBUG] Ingestion worker {os.getpid()} started")
+    connection.execute("DELETE FROM workers WHERE pid = 0")  # Slot reserved by ensure_worker_running
+    try:
+        while True:
+            connection.execute("INSERT OR REPLACE INTO workers (pid, heartbeat) VALUES (?, ?)", (os.getpid(), time.time()))
+            _requeue_stale_jobs(connection)
+            job = _claim_next_job(connection)
+            if job is None:
+                if pending_summaries:
+                    _precompute_summaries(pending_summaries.pop(0))
+                    last_job_at = time.time()
+                    continue
+                if idle_exit_seconds and time.time() - last_job_at > idle_exit_seconds:
+                    break
+                time.sleep(WORKER_POLL_SECONDS)
+                continue
+            if _run_job(job) and GOOGLE_API_KEY:
+                pending_summaries.append(job)
+            last_job_at = time.time()
+    finally:
+        connection.execute("DELETE FROM workers WHERE pid = ?", (os.getpid(),))
+        connection.close()
+        print(f"[DEBUG] Ingestion worker {os.getpid()} stopped")
+
+_worker_lock = threading.Lock()
+
+def ensure_worker_running():
+    """Starts a background worker process unless one has sent a heartbeat recently."""
+    with _worker_lock:
+        connection = _connect()
+        try:
+            row = connection.execute("SELECT MAX(heartbeat) AS heartbeat FROM workers").fetchone()
+            if row["heartbeat"] is not None and time.time() - row["heartbeat"] < 2 * HEARTBEAT_SECONDS:
+                return False
+            # Reserve the slot before spawning so concurrent sessions do not start several workers
+            connection.execute("INSERT OR REPLACE INTO workers (pid, heartbeat) VALUES (?, ?)", (0, time.time()))
+        finally:
+            connection.close()
+        log_path = os.path.join(os.path.dirname(INGEST_DB_PATH), "ingest_worker.log")
+        with open(log_path, "a", encoding="utf-8") as log_file:
+            subprocess.Popen([sys.executable, "-u", os.path.abspath(__file__)], cwd=project_dir, stdout=log_file,
+                             stderr=subprocess.STDOUT, start_new_session=True)
+        print(f"[DEBUG] Started ingestion worker, logging to {log_path}")
+        return True
+
+if __name__ == "__main__":
+    run_worker()
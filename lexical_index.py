@@ -0,0 +1,145 @@
+import json
+import math
+import os
+import re
+import threading
+from collections import Counter
+
+# Persistent BM25 inverted index over a paper's chunks.
+#
+# Dense retrieval tends to miss exact terms that dominate research questions
+# (model and dataset names, metrics such as "BLEU", symbols), so each paper
+# also gets a small inverted index stored next to its chunk store: for every
+# term, the chunk ids containing it and the term frequency in each, plus the
+# chunk lengths BM25 needs. Ids are chunk store row numbers, so lexical hits
+# line up with FAISS ids; deleted chunks are simply not indexed.
+
+BM25_K1 = 1.5
+BM25_B = 0.75
+TOKEN_PATTERN = re.compile(r"\w+")
+STOPWORDS = {
+    "a", "an", "the", "and", "or", "of", "to", "in", "on", "for", "with", "by", "is", "are", "was", "were", "be",
+    "what", "which", "how", "why", "does", "do", "did", "this", "that", "these", "it", "its", "as", "at", "from",
+    "paper", "explain", "describe", "about",
+}
+
+_lexical_cache = {}  # lexical index path -> (signature, index dict)
+_lexical_cache_lock = threading.Lock()
+
+def tokenize(text):
+    """Lower-cased word tokens of a text, stopwords removed."""
+    return [token for token in TOKEN_PATTERN.findall(text.lower()) if token not in STOPWORDS]
+
+def build_lexical_index(chunks, paper_id=""):
+    """
+    Builds an inverted index over chunk texts.
+
+    Args:
+        chunks (sequence): Chunk texts indexed by chunk id; None marks a deleted chunk.
+        paper_id (str): Identifier of the paper the chunks belong to.
+
+    Returns:
+        dict: ``postings`` (term -> [chunk ids, term frequencies]),
+        ``doc_lengths`` and ``avg_doc_length``.
+    """
+    postings = {}
+    doc_lengths = []
+    for chunk_id in range(len(chunks)):
+        chunk = chunks[chunk_id]
+        terms = Counter(tokenize(chunk)) if chunk else Counter()
+        doc_lengths.append(sum(terms.values()))
+        for term, frequency in terms.items():
+            ids, frequencies = postings.setdefault(term, ([], []))
+            ids.append(chunk_id)
+            frequencies.append(frequency)
+    indexed = [length for length in doc_lengths if length]
+    return {
+        "paper_id": paper_id,
+        "doc_count": len(indexed),
+        "avg_doc_length": sum(indexed) / len(indexed) if indexed else 0.0,
+        "doc_lengths": doc_lengths,
+        "postings": postings,
+    }
+
+def write_lexical_index(lexical_index_path, chunks, paper_id=""):
+    """Builds and saves the inverted index of a paper's chunks."""
+    lexical_index = build_lexical_index(chunks, paper_id)
+    # Write to a temporary name and swap in, so readers never see a partial file
+    with open(f"{lexical_index_path}.tmp", "w", encoding="utf-8") as f:
+        json.dump(lexical_index, f, separators=(",", ":"))
+    os.replace(f"{lexical_index_path}.tmp", lexical_index_path)
+    return lexical_index
+
+def load_lexical_index(lexical_index_path, chunks=None):
+    """
+    Loads a paper's inverted index, cached by file signature.
+
+    Papers processed before lexical indexing existed have no index file; if
+    their ``chunks`` are given the index is built and saved on first use.
+    Returns None when no index is available.
+    """
+    if not os.path.exists(lexical_index_path):
+        if chunks is None:
+            return None
+        print(f"[DEBUG] Building missing lexical index {lexical_index_path}")
+        try:
+            write_lexical_index(lexical_index_path, chunks)
+        except Exception as e:
+            print(f"[ERROR] Could not build lexical index {lexical_index_path}: {e}")
+            return None
+    stat = os.stat(lexical_index_path)
+    signature = (stat.st_mtime_ns, stat.st_size)
+    with _lexical_cache_lock:
+        cached = _lexical_cache.get(lexical_index_path)
+        if cached is not None and cached[0] == signature:
+            return cached[1]
+    try:
+        with open(lexical_index_path, "r", encoding="utf-8") as f:
+            lexical_index = json.load(f)
+    except Exception as e:
+        print(f"[ERROR] Could not read lexical index {lexical_index_path}: {e}")
+        return None
+    with _lexical_cache_lock:
+        _lexical_cache[lexical_index_path] = (signature, lexical_index)
+    return lexical_index
+
+def bm25_search(query, lexical_index, k=5, k1=BM25_K1, b=BM25_B):
+    """
+    Scores chunks against a query with BM25.
+
+    Returns:
+        list: (chunk_id, score) pairs, best first, at most k.
+    """
+    doc_count = lexical_index["doc_count"]
+    if not doc_count:
+        return []
+    doc_lengths = lexical_index["doc_lengths"]
+    avg_doc_length = lexical_index["avg_doc_length"] or 1.0
+    scores = Counter()
+    for term in set(tokenize(query)):
+        posting = lexical_index["postings"].get(term)
+        if not posting:
+            continue
+        ids, frequencies = posting
+        idf = math.log(1 + (doc_count - len(ids) + 0.5) / (len(ids) + 0.5))
+        for chunk_id, frequency in zip(ids, frequencies):
+            length_norm = k1 * (1 - b + b * doc_lengths[chunk_id] / avg_doc_length)
+            scores[chunk_id] += idf * frequency * (k1 + 1) / (frequency + length_norm)
+    return scores.most_common(k)
+
+def reciprocal_rank_fusion(rankings, k=60):
+    """
+    Fuses several best-first rankings of the same items by reciprocal rank.
+
+    Args:
+        rankings (list): Lists of hashable items, each best first.
+        k (int): Damping constant; 60 is the usual choice.
+
+    Returns:
+        list: (item, fused score) pairs, best first.
+    """
+    scores = Counter()
+    for ranking in rankings:
+        for rank, item in enumerate(ranking, start=1):
+            scores[item] += 1.0 / (k + rank)
+    return scores.most_common()
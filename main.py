@@ -1,10 +1,23 @@
 import faiss
-import pickle
+import json
 import os
 import sys
-from extract_text import extract_text_from_pdf, extract_tables_from_pdf, extract_images_from_pdf, extract_text_from_images
-from utils import get_faiss_index_filename, get_chunks_filename
-from vector_store import build_faiss_index
+import time
+import argparse
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import torch
+from extract_text import (extract_pages_from_pdf, extract_pages_parallel, get_page_fingerprints, save_page_images,
+                          ocr_images)
+from utils import (get_artifact_key, get_artifact_paths, get_artifact_paths_for_key, get_version_pointer_filename,
+                   get_pdf_content_hash, get_pipeline_fingerprint, is_pdf_processed, INGEST_WORKERS, PERSIST_IMAGES,
+                   CHUNKER_STRATEGY, CHUNK_MAX_TOKENS, CHUNK_OVERLAP_TOKENS)
+from chunker import chunk_page
+from table_store import write_table_store
+from lexical_index import write_lexical_index
+from chunk_store import ChunkStore, write_chunk_store, delete_chunk_store
+from vector_store import (build_faiss_index, encode_chunks_parallel, add_to_index, remove_from_index,
+                          initialize_embedding_model, get_token_counter)
 
 # Directory setup
 project_dir = os.path.dirname(os.path.abspath(__file__))
@@ -13,124 +26,459 @@ extracted_images_dir = os.path.join(project_dir, "extracted_images")
 os.makedirs(faiss_indexes_dir, exist_ok=True)
 os.makedirs(extracted_images_dir, exist_ok=True)
 
-def process_pdf(pdf_path, force_reprocess=False):
-    """Processes a PDF to extract text, tables, images, and builds a FAISS index."""
+# Stages reported to process_pdf's progress_callback, in order
+INGEST_STAGES = ["fingerprinting", "extracting", "ocr", "tables", "embedding", "saving", "done"]
+
+def _process_page(page, section="", count_tokens=None, paper_id=None):
+    """
+    Turns an extracted page record into its manifest entry and text chunks.
+
+    ``section`` is the heading in effect at the end of the previous page; the
+    entry records the heading in effect at the end of this one. Images are
+    only written to disk (under the paper's directory) if PERSIST_IMAGES is set.
+    """
+    # Tables follow the body text as their own paragraph; chunk spans index into this text
+    page_text = "\n\n".join(text for text in [page["text"], page["table_text"]] if text)
+    if PERSIST_IMAGES:
+        save_page_images(page, extracted_images_dir, paper_id)
+    page_chunks, final_section = chunk_page(page_text, page["page_number"], section, CHUNKER_STRATEGY,
+                                            CHUNK_MAX_TOKENS, CHUNK_OVERLAP_TOKENS, count_tokens)
+    entry = {
+        "page_number": page["page_number"],
+        "fingerprint": page["fingerprint"],
+        "section": final_section,
+        "table_text": page["table_text"],
+        "tables": page["tables"],
+        "image_texts": [],  # Filled in by process_pdf, which OCRs all pages' images together
+        "chunk_ids": [],
+    }
+    return entry, page_chunks
+
+def _load_previous_version(pdf_path, base_pdf_path=None):
+    """
+    Loads the index, chunks and page manifest of an earlier build to update incrementally.
+
+    The earlier build is ``base_pdf_path`` if given (e.g. the v1 of a revised
+    paper), otherwise whatever was last built from the same path. Returns None
+    if there is no usable earlier build.
+    """
+    try:
+        if base_pdf_path:
+            previous_key = get_artifact_key(base_pdf_path)
+        else:
+            pointer_file = get_version_pointer_filename(pdf_path)
+            if not os.path.exists(pointer_file):
+                return None
+            with open(pointer_file, "r", encoding='utf-8') as f:
+                previous_key = f.read().strip()
+        if not previous_key or previous_key == get_artifact_key(pdf_path):
+            return None
+
+        previous_paths = get_artifact_paths_for_key(previous_key)
+        if not all(os.path.exists(previous_paths[name]) for name in ["index", "chunks", "pages"]):
+            return None
+        index = faiss.read_index(previous_paths["index"])
+        if not isinstance(index, faiss.IndexIDMap2):
+            return None  # Legacy positional index, cannot be updated by id
+        chunks = ChunkStore(previous_paths["chunks"])
+        with open(previous_paths["pages"], "r", encoding='utf-8') as f:
+            manifest = json.load(f)
+        if manifest.get("pipeline") != get_pipeline_fingerprint():
+            return None  # Built with other chunking or embedding settings, so its chunks cannot be mixed in
+        print(f"[DEBUG] Updating incrementally from previous build {previous_key}")
+        return index, chunks, manifest
+    except Exception as e:
+        print(f"[WARNING] Could not load previous build for {pdf_path}, rebuilding: {e}")
+        return None
+
+def process_pdf(pdf_path, force_reprocess=False, workers=1, base_pdf_path=None, progress_callback=None):
+    """
+    Processes a PDF to extract text, tables, images, and builds a FAISS index.
+
+    If an earlier build of the same path (or of ``base_pdf_path``) exists, only
+    pages whose content fingerprint changed are re-extracted and re-embedded;
+    their old chunks are removed from the ID-mapped index and the rest are
+    kept. With ``workers > 1`` a full extraction is sharded across a process pool.
+
+    ``progress_callback(stage, fraction)``, if given, is called as the build
+    moves through the INGEST_STAGES, with the fraction of that stage done.
+
+    Returns a stats dict (page and chunk counts and seconds spent per stage)
+    on success, or None if the PDF could not be processed.
+    """
     print(f"[DEBUG] Starting to process PDF: {pdf_path}")
+    stats = {"pages": 0, "pages_extracted": 0, "chunks": 0, "chunks_embedded": 0, "stage_seconds": {}}
+    stage_clock = {"stage": None, "started": time.perf_counter()}
 
-    faiss_index_filename = get_faiss_index_filename(pdf_path)
-    faiss_index_path = os.path.join(faiss_indexes_dir, faiss_index_filename)
-    chunks_filename = os.path.join(faiss_indexes_dir, f"chunks_{faiss_index_filename}.pkl")
-    tables_file = os.path.join(faiss_indexes_dir, f"tables_{faiss_index_filename}.md")
-    image_texts_file = os.path.join(faiss_indexes_dir, f"image_texts_{faiss_index_filename}.txt")
+    def report(stage, fraction=0.0):
+        if stage != stage_clock["stage"]:
+            now = time.perf_counter()
+            if stage_clock["stage"] is not None:
+                stats["stage_seconds"][stage_clock["stage"]] = now - stage_clock["started"]
+            stage_clock.update(stage=stage, started=now)
+        if progress_callback is not None:
+            try:
+                progress_callback(stage, fraction)
+            except Exception as e:
+                print(f"[WARNING] Progress callback failed: {e}")
+
+    # Artifacts are keyed by the PDF bytes and pipeline fingerprint, not its path
+    paths = get_artifact_paths(pdf_path)
+    faiss_index_path = paths["index"]
+    chunks_filename = paths["chunks"]
+    tables_file = paths["tables"]
+    image_texts_file = paths["image_texts"]
+    pages_file = paths["pages"]
+    table_store_file = paths["table_store"]
+    lexical_index_file = paths["lexical"]
+    artifact_files = [faiss_index_path, tables_file, table_store_file, image_texts_file,
+                      pages_file, lexical_index_file]
 
     # Clean up existing files if force_reprocess
     if force_reprocess:
         print("[DEBUG] Force reprocessing - cleaning up existing files")
-        for file in [faiss_index_path, chunks_filename, tables_file, image_texts_file]:
+        for file in artifact_files:
             if os.path.exists(file):
                 try:
                     os.remove(file)
                     print(f"[DEBUG] Removed {file}")
                 except Exception as e:
                     print(f"[WARNING] Could not remove {file}: {e}")
+        delete_chunk_store(chunks_filename)
+
+    # Match pages against the previous build by content fingerprint
+    report("fingerprinting")
+    fingerprints = get_page_fingerprints(pdf_path)
+    previous = None if force_reprocess else _load_previous_version(pdf_path, base_pdf_path)
+    reusable_pages = {}
+    if previous:
+        for entry in previous[2]["pages"]:
+            reusable_pages.setdefault(entry["fingerprint"], []).append(entry)
 
-    # Extract text from PDF
-    print("[DEBUG] Extracting text from PDF...")
-    text = extract_text_from_pdf(pdf_path)
-    if not text or not isinstance(text, str) or not text.strip():
+    page_entries = [None] * len(fingerprints)
+    changed_pages = []
+    for page_index, fingerprint in enumerate(fingerprints):
+        if reusable_pages.get(fingerprint):
+            page_entries[page_index] = dict(reusable_pages[fingerprint].pop(0), page_number=page_index + 1)
+        else:
+            changed_pages.append(page_index)
+    stale_ids = [chunk_id for entries in reusable_pages.values() for entry in entries for chunk_id in entry["chunk_ids"]]
+    print(f"[DEBUG] {len(changed_pages)} of {len(fingerprints)} pages need extraction")
+    stats["pages"], stats["pages_extracted"] = len(fingerprints), len(changed_pages)
+
+    # Extract text, tables and images of new or changed pages in a single pass
+    print("[DEBUG] Extracting pages from PDF...")
+    report("extracting")  # Sharded extraction runs eagerly here, so its time must count as extracting
+    if previous is None:
+        pages = extract_pages_parallel(pdf_path, workers) if workers > 1 else extract_pages_from_pdf(pdf_path)
+    else:
+        pages = extract_pages_from_pdf(pdf_path, pages=changed_pages)
+    new_chunks = []  # dicts with text, page, section and char span
+    page_images = []  # (page entry, image bytes) pairs awaiting OCR
+    count_tokens = get_token_counter()
+    for pages_done, page in enumerate(pages, start=1):
+        # Pages arrive in order, so the previous page's entry is already known
+        previous_entry = page_entries[page["page_number"] - 2] if page["page_number"] > 1 else None
+        section = previous_entry["section"] if previous_entry else ""
+        entry, page_chunks = _process_page(page, section, count_tokens, get_pdf_content_hash(pdf_path))
+        page_entries[page["page_number"] - 1] = entry
+        new_chunks.extend(page_chunks)
+        page_images.extend((entry, image["image"]) for image in page["images"])
+        report("extracting", pages_done / max(len(changed_pages), 1))
+
+    # OCR the images of all new pages in one pooled batch, so repeats such as logos run once
+    report("ocr")
+    seen_image_texts = set()
+    for (entry, _), text in zip(page_images, ocr_images([image for _, image in page_images])):
+        if text.strip() and text not in seen_image_texts:
+            seen_image_texts.add(text)
+            entry["image_texts"].append(text)
+    page_entries = [entry for entry in page_entries if entry is not None]
+
+    reused_chunk_count = sum(len(entry["chunk_ids"]) for entry in page_entries)
+    if not new_chunks and not reused_chunk_count:
         print("[ERROR] No valid text extracted from PDF")
         return
         
-    print(f"[DEBUG] Extracted {len(text)} characters")
-    
-    # Split text into meaningful chunks
-    text_chunks = []
-    current_chunk = []
-    current_length = 0
-    
-    # Split by sentences but keep context
-    sentences = text.split(". ")
-    for sentence in sentences:
-        sentence = sentence.strip()
-        if not sentence:
-            continue
-            
-        # Add period back if it was removed by split
-        if not sentence.endswith('.'):
-            sentence += '.'
-            
-        # If adding this sentence would exceed chunk size, save current chunk
-        if current_length + len(sentence) > 1000:  # Adjust chunk size as needed
-            if current_chunk:
-                text_chunks.append(" ".join(current_chunk))
-            current_chunk = [sentence]
-            current_length = len(sentence)
-        else:
-            current_chunk.append(sentence)
-            current_length += len(sentence)
-    
-    # Add final chunk
-    if current_chunk:
-        text_chunks.append(" ".join(current_chunk))
-    
-    print(f"[DEBUG] Created {len(text_chunks)} chunks")
+    print(f"[DEBUG] Created {len(new_chunks)} new chunks, reusing {reused_chunk_count}")
+    stats["chunks"], stats["chunks_embedded"] = len(new_chunks) + reused_chunk_count, len(new_chunks)
     
     # Print first few chunks for verification
-    for i, chunk in enumerate(text_chunks[:3]):
-        print(f"[DEBUG] Chunk {i+1} preview: {chunk[:100]}...")
+    for i, chunk in enumerate(new_chunks[:3]):
+        print(f"[DEBUG] Chunk {i+1} preview: {chunk['text'][:100]}...")
 
-    print("[DEBUG] Extracting tables...")
+    print("[DEBUG] Saving tables...")
+    report("tables")
     with open(tables_file, "w", encoding='utf-8') as f:
-        for page_number in range(10):  # Extract tables from first 10 pages
-            table_text = extract_tables_from_pdf(pdf_path, page_number)
-            if table_text:
-                f.write(f"\n## Page {page_number + 1} Tables:\n{table_text}\n")
-
-    print("[DEBUG] Extracting images...")
-    image_paths = extract_images_from_pdf(pdf_path, extracted_images_dir)
-    print(f"[DEBUG] Extracted {len(image_paths)} images")
-
-    # Extract text from images and save to a file
-    print("[DEBUG] Extracting text from images...")
-    image_texts = extract_text_from_images(image_paths)
+        for entry in page_entries:
+            if entry["table_text"]:
+                f.write(f"\n## Page {entry['page_number']} Tables:\n{entry['table_text']}\n")
+    write_table_store(table_store_file, page_entries, paper_id=get_pdf_content_hash(pdf_path))
+
+    # Save text extracted from images
     with open(image_texts_file, "w", encoding='utf-8') as f:
-        f.write("\n".join(text for text in image_texts if text))
+        f.write("\n".join(text for entry in page_entries for text in entry["image_texts"]))
 
     print("[DEBUG] Building FAISS index...")
+    report("embedding")
     try:
-        faiss_index, embeddings, chunks = build_faiss_index(text_chunks, pdf_path)
-        if faiss_index is None or embeddings is None or chunks is None:
-            print("[ERROR] Failed to build FAISS index")
-            return
+        new_texts = [chunk["text"] for chunk in new_chunks]
+        if previous:
+            # Copy the previous build: it may be shared through the index cache
+            faiss_index, chunks = faiss.clone_index(previous[0]), list(previous[1])
+            chunk_metadata = [previous[1].metadata(chunk_id) for chunk_id in range(len(chunks))]
+            faiss_index = remove_from_index(faiss_index, stale_ids)
+            for chunk_id in stale_ids:
+                chunks[chunk_id] = None
+            first_new_id = len(chunks)
+            chunks.extend(new_texts)
+            chunk_metadata.extend(new_chunks)
+            if new_texts:
+                embeddings = encode_chunks_parallel(new_texts)
+                if embeddings is None:
+                    print("[ERROR] Failed to embed new chunks")
+                    return
+                add_to_index(faiss_index, embeddings, range(first_new_id, len(chunks)))
+            print(f"[DEBUG] Removed {len(stale_ids)} stale chunks, added {len(new_texts)}")
+        else:
+            faiss_index, embeddings, chunks = build_faiss_index(new_texts, pdf_path)
+            chunk_metadata = new_chunks
+            first_new_id = 0
+            if faiss_index is None or embeddings is None or chunks is None:
+                print("[ERROR] Failed to build FAISS index")
+                return
+
+        # Record the ids of newly added chunks on their pages
+        entries_by_page = {entry["page_number"]: entry for entry in page_entries}
+        for offset, chunk in enumerate(new_chunks):
+            entries_by_page[chunk["page"]]["chunk_ids"].append(first_new_id + offset)
+        # Reused chunks carry the page number of the previous build; pages may have moved since
+        for entry in page_entries:
+            for chunk_id in entry["chunk_ids"]:
+                chunk_metadata[chunk_id]["page"] = entry["page_number"]
             
         print("[DEBUG] Saving chunks...")
-        with open(chunks_filename, "wb") as f:
-            pickle.dump(chunks, f)
+        report("saving")
+        write_chunk_store(chunks_filename, chunks, chunk_metadata, paper_id=get_pdf_content_hash(pdf_path))
+
+        print("[DEBUG] Saving lexical index...")
+        write_lexical_index(lexical_index_file, chunks, paper_id=get_pdf_content_hash(pdf_path))
             
         print("[DEBUG] Saving FAISS index...")
         faiss.write_index(faiss_index, faiss_index_path)
+
+        print("[DEBUG] Saving page manifest...")
+        with open(pages_file, "w", encoding='utf-8') as f:
+            json.dump({"pdf_path": pdf_path, "pipeline": get_pipeline_fingerprint(), "pages": page_entries}, f)
+        with open(get_version_pointer_filename(pdf_path), "w", encoding='utf-8') as f:
+            f.write(get_artifact_key(pdf_path))
         
+        report("done", 1.0)
         print(f"[SUCCESS] Processing complete:")
         print(f"[SUCCESS] - Chunks saved: {chunks_filename}")
-        print(f"[SUCCESS] - Tables: {tables_file}")
-        print(f"[SUCCESS] - Images: {extracted_images_dir}")
+        print(f"[SUCCESS] - Tables: {tables_file}, {table_store_file}")
+        if PERSIST_IMAGES:
+            print(f"[SUCCESS] - Images: {os.path.join(extracted_images_dir, get_pdf_content_hash(pdf_path))}")
         print(f"[SUCCESS] - Image texts: {image_texts_file}")
         print(f"[SUCCESS] - FAISS index: {faiss_index_path}")
+        print(f"[SUCCESS] - Lexical index: {lexical_index_file}")
+        print(f"[SUCCESS] - Page manifest: {pages_file}")
+        return stats
         
     except Exception as e:
         print(f"[ERROR] Failed to build or save FAISS index: {e}")
         # Clean up any partially created files
-        for file in [faiss_index_path, chunks_filename, tables_file, image_texts_file]:
+        for file in artifact_files:
             if os.path.exists(file):
                 try:
                     os.remove(file)
                 except Exception as cleanup_error:
                     print(f"[WARNING] Could not clean up {file}: {cleanup_error}")
+        try:
+            delete_chunk_store(chunks_filename)
+        except Exception as cleanup_error:
+            print(f"[WARNING] Could not clean up {chunks_filename}: {cleanup_error}")
+
+def _init_ingest_worker(threads_per_worker):
+    """Pool initializer: caps torch threads and loads the embedding model once per worker."""
+    torch.set_num_threads(threads_per_worker)
+    initialize_embedding_model()
+
+def collect_pdf_paths(inputs):
+    """
+    Expands CLI inputs into a de-duplicated list of PDF paths.
+
+    Each input may be a PDF, a directory (searched recursively for PDFs) or a
+    manifest: a text file listing one PDF path per line (blank lines and
+    ``#`` comments are ignored; relative paths are resolved against the
+    manifest's directory) or a JSON file holding a list of paths.
+    """
+    pdf_paths = []
+    for item in inputs:
+        if os.path.isdir(item):
+            for root, _, files in os.walk(item):
+                pdf_paths.extend(os.path.join(root, name) for name in sorted(files) if name.lower().endswith(".pdf"))
+        elif item.lower().endswith(".pdf"):
+            pdf_paths.append(item)
+        elif os.path.isfile(item):
+            with open(item, "r", encoding="utf-8") as f:
+                if item.lower().endswith(".json"):
+                    entries = json.load(f)
+                else:
+                    entries = [line.strip() for line in f if line.strip() and not line.lstrip().startswith("#")]
+            manifest_dir = os.path.dirname(os.path.abspath(item))
+            pdf_paths.extend(os.path.join(manifest_dir, entry) for entry in entries)
+        else:
+            print(f"[WARNING] Skipping {item}: not a PDF, directory or manifest")
+    seen = set()
+    unique_paths = []
+    for pdf_path in pdf_paths:
+        absolute_path = os.path.abspath(pdf_path)
+        if absolute_path not in seen:
+            seen.add(absolute_path)
+            unique_paths.append(absolute_path)
+    return unique_paths
+
+def _checkpoint_key(pdf_path):
+    """Identifies a file version cheaply (no hashing), so resumed runs skip finished papers quickly."""
+    stat = os.stat(pdf_path)
+    return f"{pdf_path}:{stat.st_size}:{stat.st_mtime_ns}"
+
+def load_checkpoint(checkpoint_path):
+    """Returns checkpoint records keyed by file version; later records win."""
+    records = {}
+    if checkpoint_path and os.path.exists(checkpoint_path):
+        with open(checkpoint_path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                    records[record["key"]] = record
+                except (ValueError, KeyError):
+                    continue  # A run killed mid-write can leave a truncated last line
+    return records
+
+def _ingest_worker(pdf_path, force_reprocess):
+    """Pool worker: processes one PDF and returns (pdf_path, stats, error)."""
+    try:
+        stats = process_pdf(pdf_path, force_reprocess=force_reprocess)
+        return pdf_path, stats, None if stats else "Processing failed, see log"
+    except Exception as e:
+        return pdf_path, None, str(e)
+
+def _print_throughput(results, wall_seconds):
+    """Prints papers, pages and chunks per second, overall and per pipeline stage."""
+    finished = [stats for stats in results if stats]
+    pages = sum(stats["pages_extracted"] for stats in finished)
+    chunks = sum(stats["chunks_embedded"] for stats in finished)
+    print(f"[SUCCESS] Ingested {len(finished)} papers, {pages} pages, {chunks} chunks in {wall_seconds:.1f}s "
+          f"({len(finished) / wall_seconds:.2f} papers/s, {pages / wall_seconds:.1f} pages/s, "
+          f"{chunks / wall_seconds:.1f} chunks/s)")
+    # Stage time is summed over workers, so these rates are per worker
+    for stage in INGEST_STAGES[:-1]:
+        seconds = sum(stats["stage_seconds"].get(stage, 0.0) for stats in finished)
+        if not seconds:
+            continue
+        rates = f"{pages / seconds:.1f} pages/s" if stage in ("extracting", "ocr", "tables") else ""
+        if stage == "embedding":
+            rates = f"{chunks / seconds:.1f} chunks/s"
+        print(f"[DEBUG]   {stage:<15}{seconds:8.1f}s  {rates}")
+
+def ingest_batch(pdf_paths, workers=INGEST_WORKERS, force_reprocess=False, checkpoint_path=None):
+    """
+    Builds indexes for many PDFs, checkpointing each finished paper.
+
+    Papers are spread over a process pool of ``workers`` (or processed in
+    this process, with pages sharded, when there is one worker or paper).
+    Each result is appended to the JSONL checkpoint as soon as it is known,
+    so an interrupted run resumes without re-opening finished papers;
+    content-addressed artifacts make the resume safe even without it.
+
+    Returns:
+        dict: Counts of ``done``, ``skipped`` and ``failed`` papers.
+    """
+    checkpoint = {} if force_reprocess else load_checkpoint(checkpoint_path)
+    pending = []
+    pending_keys = set()
+    skipped = 0
+    for pdf_path in pdf_paths:
+        if not os.path.exists(pdf_path):
+            print(f"[WARNING] Skipping missing file {pdf_path}")
+            continue
+        if checkpoint.get(_checkpoint_key(pdf_path), {}).get("status") == "done":
+            skipped += 1  # Checked before anything hashes the file
+        elif not force_reprocess and is_pdf_processed(pdf_path):
+            skipped += 1  # Built by an earlier run or the app; artifacts are content-addressed
+        elif get_artifact_key(pdf_path) in pending_keys:
+            skipped += 1  # Identical files share one artifact key, so each distinct paper is built once
+        else:
+            pending.append(pdf_path)
+            pending_keys.add(get_artifact_key(pdf_path))  # Content hash is memoised, the file is read once
+    print(f"[DEBUG] {len(pending)} PDFs to ingest, {skipped} already done")
+
+    counts = {"done": 0, "skipped": skipped, "failed": 0}
+    results = []
+    started = time.perf_counter()
+    checkpoint_file = open(checkpoint_path, "a", encoding="utf-8") if checkpoint_path else None
+
+    def record(pdf_path, stats, error):
+        counts["failed" if error else "done"] += 1
+        results.append(stats)
+        if error:
+            print(f"[ERROR] {pdf_path}: {error}")
+        if checkpoint_file:
+            checkpoint_file.write(json.dumps({"key": _checkpoint_key(pdf_path), "pdf_path": pdf_path,
+                                              "status": "failed" if error else "done", "error": error,
+                                              "stats": stats}) + "\n")
+            checkpoint_file.flush()
+        print(f"[DEBUG] Progress: {counts['done'] + counts['failed']}/{len(pending)} "
+              f"({counts['failed']} failed)")
+
+    try:
+        if len(pending) == 1 or workers <= 1:
+            initialize_embedding_model()
+            for pdf_path in pending:
+                try:
+                    stats = process_pdf(pdf_path, force_reprocess=force_reprocess, workers=workers)
+                    record(pdf_path, stats, None if stats else "Processing failed, see log")
+                except Exception as e:
+                    record(pdf_path, None, str(e))
+        elif pending:
+            workers = min(workers, len(pending))
+            threads_per_worker = max(1, (os.cpu_count() or 1) // workers)
+            with ProcessPoolExecutor(max_workers=workers,
+                                     mp_context=multiprocessing.get_context("spawn"),
+                                     initializer=_init_ingest_worker,
+                                     initargs=(threads_per_worker,)) as executor:
+                futures = [executor.submit(_ingest_worker, pdf_path, force_reprocess) for pdf_path in pending]
+                for future in as_completed(futures):
+                    record(*future.result())
+    finally:
+        if checkpoint_file:
+            checkpoint_file.close()
+
+    if results:
+        _print_throughput(results, time.perf_counter() - started)
+    return counts
+
+def _parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Build ArxivLensAI indexes for one or many PDFs.")
+    parser.add_argument("inputs", nargs="+",
+                        help="PDF files, directories of PDFs, or manifests (.txt with one path per line, or .json list)")
+    parser.add_argument("--workers", type=int, default=INGEST_WORKERS,
+                        help=f"Parallel worker processes (default: {INGEST_WORKERS})")
+    parser.add_argument("--checkpoint", default=os.path.join(faiss_indexes_dir, "ingest_checkpoint.jsonl"),
+                        help="JSONL file recording finished papers, used to resume interrupted runs")
+    parser.add_argument("--no-checkpoint", action="store_true", help="Do not read or write a checkpoint")
+    parser.add_argument("--force", action="store_true", help="Rebuild papers even if already processed")
+    return parser.parse_args(argv)
 
 if __name__ == "__main__":
-    if len(sys.argv) < 2:
-        print("[ERROR] Please provide a PDF file path.")
+    args = _parse_args()
+    pdf_paths = collect_pdf_paths(args.inputs)
+    if not pdf_paths:
+        print("[ERROR] No PDF files found in the given inputs.")
         sys.exit(1)
-
-    pdf_path = sys.argv[1]
-    process_pdf(pdf_path)
+    counts = ingest_batch(pdf_paths, workers=max(args.workers, 1), force_reprocess=args.force,
+                          checkpoint_path=None if args.no_checkpoint else args.checkpoint)
+    print(f"[SUCCESS] Done: {counts['done']}, skipped: {counts['skipped']}, failed: {counts['failed']}")
+    sys.exit(1 if counts["failed"] else 0)
@@ -0,0 +1,102 @@
+import re
+from chunker import approximate_token_count
+from utils import PROMPT_CONTEXT_TOKENS, PROMPT_DEDUP_THRESHOLD
+
+# Token-budgeted assembly of the paper context sent to Gemini.
+#
+# Passages (retrieved chunks, table and image text) arrive best first. Near
+# duplicates, such as overlapping neighbouring chunks or a table that was
+# also extracted as page text, are detected by word-shingle overlap and
+# dropped; the rest are packed in relevance order until the token budget is
+# spent, cutting the last passage at a sentence or word boundary if needed.
+
+SHINGLE_SIZE = 4
+# A passage cut shorter than this is dropped rather than sent as a fragment
+MIN_PASSAGE_TOKENS = 48
+SECTION_HEADINGS = {"tables": "Information from tables:", "images": "Information from images:"}
+
+def count_tokens(text):
+    """Estimates the LLM tokens in a text (words and punctuation, plus word-piece overhead)."""
+    return approximate_token_count(text) if text else 0
+
+def _shingles(text):
+    """Sets of SHINGLE_SIZE consecutive lower-cased words, the unit of duplicate detection."""
+    words = re.findall(r"\w+", text.lower())
+    if len(words) <= SHINGLE_SIZE:
+        return {tuple(words)} if words else set()
+    return {tuple(words[i:i + SHINGLE_SIZE]) for i in range(len(words) - SHINGLE_SIZE + 1)}
+
+def is_near_duplicate(shingles, kept_shingles, threshold=PROMPT_DEDUP_THRESHOLD):
+    """
+    True when a passage is mostly repeated text: its Jaccard similarity with a
+    kept passage, or the share of its shingles contained in one, reaches the threshold.
+    """
+    if not shingles:
+        return True
+    for other in kept_shingles:
+        overlap = len(shingles & other)
+        if overlap / len(shingles | other) >= threshold or overlap / len(shingles) >= threshold:
+            return True
+    return False
+
+def _truncate_to_tokens(text, max_tokens):
+    """Cuts text to at most max_tokens, at the last sentence end if one is near, else at a word."""
+    words = text.split()
+    low, high = 0, len(words)
+    while low < high:  # Longest word prefix within the budget
+        middle = (low + high + 1) // 2
+        if count_tokens(" ".join(words[:middle])) <= max_tokens:
+            low = middle
+        else:
+            high = middle - 1
+    cut = " ".join(words[:low])
+    sentence_end = max(cut.rfind(". "), cut.rfind("? "), cut.rfind("! "))
+    if sentence_end > len(cut) // 2:
+        cut = cut[:sentence_end + 1]
+    return cut
+
+def pack_context(passages, budget_tokens=PROMPT_CONTEXT_TOKENS, dedup_threshold=PROMPT_DEDUP_THRESHOLD):
+    """
+    Deduplicates passages and packs them, most relevant first, into a token budget.
+
+    Args:
+        passages (list): (text, kind) pairs in relevance order; kind is
+            "chunks", "tables" or "images" and decides the section the text appears under.
+        budget_tokens (int): Maximum tokens of context.
+        dedup_threshold (float): Shingle overlap at which a passage counts as a duplicate.
+
+    Returns:
+        tuple: (context text, the (text, kind) passages kept, report dict with
+        ``passages``, ``duplicates``, ``dropped``, ``truncated`` counts and ``context_tokens``)
+    """
+    report = {"passages": len(passages), "duplicates": 0, "dropped": 0, "truncated": 0, "context_tokens": 0}
+    kept = []
+    kept_shingles = []
+    remaining = budget_tokens
+    for text, kind in passages:
+        text = text.strip() if text else ""
+        shingles = _shingles(text)
+        if is_near_duplicate(shingles, kept_shingles, dedup_threshold):
+            report["duplicates"] += 1
+            continue
+        tokens = count_tokens(text)
+        if tokens > remaining:
+            if remaining < MIN_PASSAGE_TOKENS:
+                report["dropped"] += 1
+                continue
+            text = _truncate_to_tokens(text, remaining)
+            tokens = count_tokens(text)
+            report["truncated"] += 1
+        kept.append((text, kind))
+        kept_shingles.append(shingles)
+        remaining -= tokens
+
+    parts = [text for text, kind in kept if kind == "chunks"]
+    for section in ["images", "tables"]:
+        section_texts = [text for text, kind in kept if kind == section]
+        if section_texts:
+            parts.append(f"\n{SECTION_HEADINGS[section]}")
+            parts.extend(section_texts)
+    context = "\n".join(parts)
+    report["context_tokens"] = count_tokens(context)
+    return context, kept, report
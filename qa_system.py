@@ -1,11 +1,17 @@
 from transformers import pipeline
 import os
+import time
+import hashlib
+import threading
+from cachetools import LRUCache
 from vector_store import search_faiss
 from transformers import AutoTokenizer, AutoModelForSeq2SeqLM
 import google.generativeai as genai
 import torch
 import streamlit as st
-from utils import GOOGLE_API_KEY, HUGGINGFACE_API_KEY
+from prompt_builder import pack_context, count_tokens
+from utils import (GOOGLE_API_KEY, HUGGINGFACE_API_KEY, ANSWER_LENGTH_POLICY, ANSWER_MIN_WORDS,
+                   SPAN_EXTRACTION_POLICY, SPAN_CACHE_SIZE)
 
 torch.classes.__path__ = []
 
@@ -38,6 +44,10 @@ def set_gemini_model_name(model_name: str):
 	_gemini_model_name = _normalize_gemini_model_name(model_name)
 	_gemini_model = None
 
+def get_gemini_model_name():
+	"""Name of the Gemini model answering questions."""
+	return _gemini_model_name
+
 def get_gemini_model():
 	global _gemini_model
 	if _gemini_model is not None:
@@ -68,18 +78,111 @@ def get_retrieval_pipeline():
 		print(f"⚠️ Retrieval pipeline failed to load: {e}")
 		return None
 
-def generate_research_answer(context, query, retrieved_text):
-    """Uses Gemini to generate research-focused answers based on retrieved text."""
-    
-    print(f"[DEBUG] Generating research answer for query: {query}")
-    print(f"[DEBUG] Context length: {len(context)}")
-    print(f"[DEBUG] Retrieved text length: {len(retrieved_text)}")
-    
+SPAN_EXTRACTION_POLICIES = ("batched", "full", "off")
+# RoBERTa's window limits; the per-chunk window shrinks to fit the longest passage
+SPAN_MAX_SEQ_LEN = 384
+SPAN_MIN_SEQ_LEN = 128
+SPAN_MAX_QUESTION_LEN = 64
+
+# Extracted spans per (policy, question, passages), so repeated questions skip the QA model
+_span_cache = LRUCache(maxsize=SPAN_CACHE_SIZE)
+_span_cache_lock = threading.Lock()
+span_cache_stats = {"hits": 0, "misses": 0}
+
+def _span_cache_key(policy, query, passages):
+    """Keys a span extraction by policy, question and the content of its passages."""
+    digest = hashlib.sha1()
+    for passage in passages:
+        digest.update(hashlib.sha1(passage.encode("utf-8")).digest())
+    return (policy, query, digest.hexdigest())
+
+def _span_window(passages):
+    """Chooses max_seq_len and doc_stride so the longest passage usually fits in one window."""
+    longest = max(count_tokens(passage) for passage in passages)
+    needed = longest + SPAN_MAX_QUESTION_LEN + 4  # Question plus special tokens
+    max_seq_len = min(SPAN_MAX_SEQ_LEN, max(SPAN_MIN_SEQ_LEN, -(-needed // 64) * 64))
+    return max_seq_len, max_seq_len // 4
+
+def extract_relevant_span(query, passages, combined_context, policy=SPAN_EXTRACTION_POLICY):
+    """
+    Picks out the passage text that best answers the query with the RoBERTa QA pipeline.
+
+    Args:
+        query (str): The question, including any conversation context.
+        passages (list): The chunks, image texts and table texts making up the context.
+        combined_context (str): The same context joined into one string, used by the "full" policy.
+        policy (str): "batched" scores every passage in one batched call and keeps
+            the best answer, "full" runs over the combined context, "off" skips extraction.
+
+    Returns:
+        str: The extracted span, or "" when skipped or unavailable.
+    """
+    if policy not in SPAN_EXTRACTION_POLICIES:
+        raise ValueError(f"Unknown span extraction policy: {policy}. Expected one of {SPAN_EXTRACTION_POLICIES}")
+    passages = [passage for passage in passages if passage and passage.strip()]
+    if policy == "off" or not passages:
+        return ""
+    cache_key = _span_cache_key(policy, query, passages)
+    with _span_cache_lock:
+        if cache_key in _span_cache:
+            span_cache_stats["hits"] += 1
+            return _span_cache[cache_key]
+        span_cache_stats["misses"] += 1
+
+    retrieval_pipeline = get_retrieval_pipeline()
+    if retrieval_pipeline is None:
+        return ""
+    started = time.perf_counter()
+    try:
+        if policy == "full":
+            span = retrieval_pipeline(question=query, context=combined_context).get("answer", "")
+        else:
+            max_seq_len, doc_stride = _span_window(passages)
+            results = retrieval_pipeline(question=[query] * len(passages), context=passages,
+                                         batch_size=len(passages), max_seq_len=max_seq_len, doc_stride=doc_stride,
+                                         max_question_len=SPAN_MAX_QUESTION_LEN)
+            results = results if isinstance(results, list) else [results]
+            best = max(results, key=lambda result: result.get("score", 0.0))
+            span = best.get("answer", "")
+    except Exception as e:
+        print(f"[WARNING] Retrieval pipeline error: {e}")
+        return ""
+    print(f"[DEBUG] Span extraction ({policy}, {len(passages)} passages) took {time.perf_counter() - started:.2f}s")
+    with _span_cache_lock:
+        _span_cache[cache_key] = span
+    return span
+
+# How often answers fall short of the length target and trigger the "continue" fallback
+answer_policy_stats = {"answers": 0, "short_answers": 0, "continuations": 0, "continuation_words": 0}
+# Words of the previous answer sent back with a continuation request
+CONTINUATION_TAIL_WORDS = 150
+
+def get_answer_policy_stats():
+    """Returns answer length policy counters and the share of answers that needed a continuation."""
+    answers = answer_policy_stats["answers"]
+    return {
+        **answer_policy_stats,
+        "policy": ANSWER_LENGTH_POLICY,
+        "fallback_rate": answer_policy_stats["continuations"] / answers if answers else 0.0,
+    }
+
+def get_answer_length_target(policy=None):
+    """Returns the minimum answer length in words the policy asks for, or None when length is not enforced."""
+    return None if (policy or ANSWER_LENGTH_POLICY) == "off" else ANSWER_MIN_WORDS
+
+def build_research_prompt(context, query, retrieved_text, min_words=ANSWER_MIN_WORDS):
+    """
+    Builds the Gemini prompt for a research question (or a summary request) over the paper context.
+    The length target is stated here, once, rather than enforced by regenerating the answer.
+    """
     if "summary" in query.lower() or "summarize" in query.lower():
         # If the query is asking for a summary, generate a summary of the context
+        length_instruction = (f"Ensure the summary is at least {min_words} words long, covering all key points and "
+                              "providing in-depth analysis." if min_words else
+                              "Cover all key points and provide in-depth analysis.")
         prompt = f"""
         You are an AI research assistant. Provide a detailed and comprehensive summary of the following research paper context.
-        Ensure the summary is at least 450 words long, covering all key points and providing in-depth analysis.
+        {length_instruction}
 
         **Context from research paper:**
         {context}
@@ -97,9 +200,12 @@ def generate_research_answer(context, query, retrieved_text):
         """
     else:
         # For other types of queries, generate a detailed, research-oriented response
+        length_instruction = (f"Ensure the response is at least {min_words} words long, providing detailed "
+                              "explanations, examples, and relevant context." if min_words else
+                              "Provide detailed explanations, examples, and relevant context.")
         prompt = f"""
         You are an AI research assistant. Answer the user's query based STRICTLY on the research paper content.
-        Ensure the response is at least 450 words long, providing detailed explanations, examples, and relevant context.
+        {length_instruction}
 
         **Context from research paper:**
         {context}
@@ -119,6 +225,15 @@ def generate_research_answer(context, query, retrieved_text):
         
         Provide a **detailed, research-oriented** response in clear language.
         """
+    return prompt
+
+def generate_research_answer(context, query, retrieved_text):
+    """Uses Gemini to generate research-focused answers based on retrieved text."""
+    
+    print(f"[DEBUG] Generating research answer for query: {query}")
+    print(f"[DEBUG] Context length: {len(context)}")
+    print(f"[DEBUG] Retrieved text length: {len(retrieved_text)}")
+    prompt = build_research_prompt(context, query, retrieved_text, get_answer_length_target())
 
     try:
         print("[DEBUG] Sending prompt to Gemini model...")
@@ -138,10 +253,174 @@ def generate_research_answer(context, query, retrieved_text):
         print(f"[ERROR] Failed to generate research answer: {e}")
         return f"⚠️ Error generating response: {str(e)}"
 
-def generate_answer_huggingface(query, retrieved_chunks, memory=None, image_texts=None, table_texts=None, full_context=False):
+def stream_research_answer(context, query, retrieved_text, metrics=None):
+    """
+    Streams a research answer from Gemini, yielding text fragments as they arrive.
+
+    If ``metrics`` is given it is filled with ``ttft`` (seconds from
+    ``metrics["started_at"]``, or from this call, to the first fragment),
+    ``total`` (seconds to the last fragment) and ``chars`` streamed.
+    """
+    print(f"[DEBUG] Streaming research answer for query: {query}")
+    prompt = build_research_prompt(context, query, retrieved_text, get_answer_length_target())
+    yield from stream_gemini_response(prompt, metrics)
+
+def stream_gemini_response(prompt, metrics=None):
+    """
+    Streams Gemini's response to a prompt, recording ``ttft``, ``total`` and ``chars`` in metrics.
+
+    If no answer could be generated, or the stream broke off, an error message
+    is yielded and ``metrics["failed"]`` is set, so the partial answer is not cached.
+    """
+    metrics = metrics if metrics is not None else {}
+    metrics.setdefault("started_at", time.perf_counter())
+    gemini_model = get_gemini_model()
+    if gemini_model is None:
+        metrics["failed"] = True
+        yield "⚠️ Gemini model is not available. Please configure GOOGLE_API_KEY."
+        return
+    streamed_chars = 0
+    try:
+        print("[DEBUG] Sending streaming prompt to Gemini model...")
+        for chunk in gemini_model.generate_content(prompt, stream=True):
+            try:
+                text = chunk.text
+            except ValueError:
+                continue  # Fragment without text parts, e.g. only safety metadata
+            if not text:
+                continue
+            if "ttft" not in metrics:
+                metrics["ttft"] = time.perf_counter() - metrics["started_at"]
+                print(f"[DEBUG] Time to first token: {metrics['ttft']:.2f}s")
+            streamed_chars += len(text)
+            yield text
+        if not streamed_chars:
+            print("[WARNING] Gemini model returned empty response")
+            metrics["failed"] = True
+            yield "⚠️ Could not generate a response based on the paper content."
+    except Exception as e:
+        print(f"[ERROR] Failed to stream research answer: {e}")
+        metrics["failed"] = True
+        yield f"⚠️ Error generating response: {str(e)}"
+    finally:
+        metrics["total"] = time.perf_counter() - metrics["started_at"]
+        metrics["chars"] = streamed_chars
+        print(f"[DEBUG] Streamed {streamed_chars} characters in {metrics['total']:.2f}s")
+
+def _continuation_words_needed(answer):
+    """
+    Records an answer against the length policy and returns how many more words
+    a continuation should add (0 unless the policy is "continue" and the answer is short).
+    """
+    min_words = get_answer_length_target()
+    answer_policy_stats["answers"] += 1
+    words = len(answer.split())
+    if min_words is None or words >= min_words or answer.lstrip().startswith("⚠️"):
+        return 0
+    answer_policy_stats["short_answers"] += 1
+    if ANSWER_LENGTH_POLICY != "continue":
+        return 0
+    answer_policy_stats["continuations"] += 1
+    print(f"[DEBUG] Answer has {words} of {min_words} target words, requesting a continuation")
+    return min_words - words
+
+def build_continuation_prompt(query, answer, retrieved_text, missing_words):
+    """
+    Builds a follow-up prompt that continues a short answer. Only the tail of the
+    answer so far and the extracted passage are sent, not the full paper context again.
+    """
+    tail = " ".join(answer.split()[-CONTINUATION_TAIL_WORDS:])
+    return f"""
+        You are an AI research assistant continuing an answer about a research paper.
+
+        **User's question:**
+        {query}
+
+        **Most relevant extracted text:**
+        {retrieved_text}
+
+        **End of the answer so far:**
+        ...{tail}
+
+        Continue the answer from where it stops with about {missing_words} more words of further detail,
+        examples and implications. Do not repeat what has already been said, do not restart the answer,
+        and do not add information that is not supported by the paper.
+        """
+
+def continue_research_answer(query, answer, retrieved_text, missing_words, stream=False):
+    """
+    Asks Gemini to continue a short answer.
+
+    Returns the continuation text ("" on failure), or with ``stream=True`` an
+    iterator of continuation fragments. Without paper text to ground it there
+    is no continuation.
+    """
+    prompt = build_continuation_prompt(query, answer, retrieved_text, missing_words)
+    gemini_model = get_gemini_model()
+    if gemini_model is None or not retrieved_text:
+        return iter([]) if stream else ""
+    if stream:
+        return _stream_continuation(gemini_model, prompt)
+    try:
+        response = gemini_model.generate_content(prompt)
+        continuation = response.text.strip() if response and response.text else ""
+    except Exception as e:
+        print(f"[WARNING] Answer continuation failed: {e}")
+        return ""
+    answer_policy_stats["continuation_words"] += len(continuation.split())
+    return continuation
+
+def _stream_continuation(gemini_model, prompt):
+    """Yields continuation fragments from Gemini, stopping quietly on errors."""
+    try:
+        for chunk in gemini_model.generate_content(prompt, stream=True):
+            try:
+                text = chunk.text
+            except ValueError:
+                continue
+            if text:
+                answer_policy_stats["continuation_words"] += len(text.split())
+                yield text
+    except Exception as e:
+        print(f"[WARNING] Answer continuation failed: {e}")
+
+def _stream_with_length_policy(fragments, query, retrieved_text, metrics):
+    """Passes streamed answer fragments through, then streams a continuation if the policy asks for one."""
+    streamed = []
+    for text in fragments:
+        streamed.append(text)
+        yield text
+    answer = "".join(streamed)
+    missing_words = 0 if metrics.get("failed") else _continuation_words_needed(answer)
+    if missing_words and retrieved_text:
+        yield "\n\n"
+        yield from continue_research_answer(query, answer, retrieved_text, missing_words, stream=True)
+        metrics["total"] = time.perf_counter() - metrics["started_at"]
+    metrics["continued"] = bool(missing_words and retrieved_text)
+
+def get_previous_questions(memory):
+    """User questions among the last conversation turns; they are added to the prompt as context."""
+    return [m["content"] for m in (memory or [])[-3:] if m["role"] == "user"]
+
+def generate_answer_huggingface(query, retrieved_chunks, memory=None, image_texts=None, table_texts=None, full_context=False,
+                                stream=False, metrics=None, max_chunks=3, extract_span=True):
     """
     Processes retrieved text, extracts relevant data, and generates a response using Gemini.
+
+    The first ``max_chunks`` retrieved chunks form the context. ``extract_span``
+    runs the RoBERTa QA pipeline (as set by SPAN_EXTRACTION_POLICY) to pick out
+    the most relevant passage; it can be turned off when the chunks were
+    already re-ranked by a cross-encoder.
+
+    With ``stream=True`` the context is prepared eagerly and an iterator of
+    answer fragments is returned (e.g. for ``st.write_stream``). Short answers
+    are handled by ANSWER_LENGTH_POLICY, which can append a continuation but
+    never regenerates the whole answer. ``metrics``,
+    if given, receives ``ttft`` and ``total`` latency in seconds, measured
+    from ``metrics["started_at"]`` when set.
     """
+    metrics = metrics if metrics is not None else {}
+    metrics.setdefault("started_at", time.perf_counter())
     print(f"[DEBUG] Processing query: {query}")
     print(f"[DEBUG] Retrieved chunks: {len(retrieved_chunks)}")
     print(f"[DEBUG] Image texts: {len(image_texts) if image_texts else 0}")
@@ -149,64 +428,62 @@ def generate_answer_huggingface(query, retrieved_chunks, memory=None, image_text
 
     try:
         # ✅ Step 1: Handle full context request
-        if full_context:
-            context = " ".join(retrieved_chunks)  # Use all retrieved chunks
-        else:
-            if not retrieved_chunks:
-                print("[WARNING] No relevant chunks found")
-                return "I could not find relevant information in the paper to answer your question."
+        if not full_context and not retrieved_chunks:
+            print("[WARNING] No relevant chunks found")
+            message = "I could not find relevant information in the paper to answer your question."
+            return iter([message]) if stream else message
+        # Use all retrieved chunks for full context, otherwise the most relevant ones
+        chunks = retrieved_chunks if full_context else retrieved_chunks[:max_chunks]
 
-            # Use top chunks for focused context
-            context = " ".join(retrieved_chunks[:3])  # Use top 3 most relevant chunks
-
-        # ✅ Step 2: Add image and table context
-        context_parts = [context]
-        
-        if image_texts:
-            context_parts.append("\nInformation from images:")
-            context_parts.extend(image_texts)
-            
-        if table_texts:
-            context_parts.append("\nInformation from tables:")
-            context_parts.extend(table_texts)
-            
-        combined_context = "\n".join(context_parts)
-        print(f"[DEBUG] Combined context length: {len(combined_context)}")
+        # ✅ Step 2: Add table and image context, deduplicated and packed into the token budget
+        passages = ([(chunk, "chunks") for chunk in chunks] + [(text, "tables") for text in table_texts or []] +
+                    [(text, "images") for text in image_texts or []])
+        combined_context, packed_passages, context_report = pack_context(passages)
+        metrics["context_tokens"] = context_report["context_tokens"]
+        print(f"[DEBUG] Packed context: {context_report}")
 
         # ✅ Step 3: Get past context if available
         if memory:
-            past_queries = [m["content"] for m in memory[-3:] if m["role"] == "user"]
+            past_queries = get_previous_questions(memory)
             if past_queries:
                 query_context = "Previous questions: " + "; ".join(past_queries)
                 print(f"[DEBUG] Added query context: {query_context}")
                 query = f"{query_context}\nCurrent question: {query}"
 
         # ✅ Step 4: Extract most relevant text
-        retrieved_text = ""
-        retrieval_pipeline = get_retrieval_pipeline()
-        if retrieval_pipeline:
-            try:
-                ret_result = retrieval_pipeline(question=query, context=combined_context)
-                retrieved_text = ret_result.get('answer', "")
-                print(f"[DEBUG] Retrieved specific text: {retrieved_text[:100]}...")
-            except Exception as e:
-                print(f"[WARNING] Retrieval pipeline error: {e}")
+        retrieved_text = extract_relevant_span(query, [text for text, _ in packed_passages], combined_context,
+                                               SPAN_EXTRACTION_POLICY if extract_span else "off")
+        if retrieved_text:
+            print(f"[DEBUG] Retrieved specific text: {retrieved_text[:100]}...")
+        # A continuation sees only the tail of the answer, so it gets the extracted span or, when span
+        # extraction is off (re-ranked chunks), the top packed passage as the paper text to build on
+        continuation_text = retrieved_text or next((text for text, _ in packed_passages), "")
+        metrics["prompt_tokens"] = count_tokens(build_research_prompt(combined_context, query, retrieved_text,
+                                                                      get_answer_length_target()))
+        print(f"[DEBUG] Prompt size: {metrics['prompt_tokens']} tokens")
 
         # ✅ Step 5: Generate research-based answer
+        if stream:
+            print("[DEBUG] Streaming final answer...")
+            fragments = stream_research_answer(combined_context, query, retrieved_text, metrics)
+            return _stream_with_length_policy(fragments, query, continuation_text, metrics)
         print("[DEBUG] Generating final answer...")
         answer = generate_research_answer(combined_context, query, retrieved_text)
 
-        # ✅ Step 6: Ensure comprehensive response
-        if len(answer.split()) < 450:
-            print("[DEBUG] Answer too short, generating enriched response...")
-            additional_context = "To provide a more comprehensive response, let's explore additional insights."
-            enriched_answer = generate_research_answer(combined_context, query, retrieved_text + " " + additional_context)
-            if len(enriched_answer.split()) > 450:
-                answer = enriched_answer
+        # ✅ Step 6: Apply the answer length policy (a continuation, never a second full generation)
+        missing_words = _continuation_words_needed(answer)
+        if missing_words:
+            continuation = continue_research_answer(query, answer, continuation_text, missing_words)
+            if continuation:
+                answer = f"{answer}\n\n{continuation}"
+        metrics["continued"] = bool(missing_words)
 
-        print("[DEBUG] Successfully generated answer")
+        # Without streaming the first token arrives with the whole answer
+        metrics["ttft"] = metrics["total"] = time.perf_counter() - metrics["started_at"]
+        print(f"[DEBUG] Successfully generated answer in {metrics['total']:.2f}s")
         return answer
 
     except Exception as e:
         print(f"[ERROR] Answer generation failed: {e}")
-        return f"⚠️ Error generating answer: {str(e)}"
+        message = f"⚠️ Error generating answer: {str(e)}"
+        return iter([message]) if stream else message
@@ -0,0 +1,101 @@
+import time
+from sentence_transformers import CrossEncoder
+from vector_store import get_embedding_device
+from utils import RERANK_MODEL_NAME, RERANK_TOP_N, RERANK_BUDGET_MS, HUGGINGFACE_API_KEY
+
+# Cross-encoder re-ranking of retrieved chunks.
+#
+# Retrieval casts a wide net (RERANK_CANDIDATES hits); the cross-encoder then
+# reads each (query, chunk) pair jointly in one batched forward pass and keeps
+# the RERANK_TOP_N best, so fewer and better chunks reach the LLM. A running
+# estimate of the cost per pair trims the candidate list up front when scoring
+# all of it would exceed the latency budget; candidates arrive best first from
+# retrieval, so the weakest ones are dropped.
+
+# Weight of the latest call in the running per-pair latency estimate
+LATENCY_SMOOTHING = 0.3
+
+rerank_stats = {"calls": 0, "pairs_scored": 0, "candidates_trimmed": 0, "over_budget": 0, "seconds_per_pair": None}
+
+_reranker = None
+_reranker_failed = False
+def get_reranker():
+    """Loads the cross-encoder once, or returns None if it is unavailable (a failed load is not retried)."""
+    global _reranker, _reranker_failed
+    if _reranker is not None or _reranker_failed:
+        return _reranker
+    try:
+        model_kwargs = {"device": get_embedding_device(), "max_length": 512}
+        if HUGGINGFACE_API_KEY:
+            # CrossEncoder has no token argument; it is forwarded to the model and tokenizer loaders
+            model_kwargs["automodel_args"] = {"token": HUGGINGFACE_API_KEY}
+            model_kwargs["tokenizer_args"] = {"token": HUGGINGFACE_API_KEY}
+        _reranker = CrossEncoder(RERANK_MODEL_NAME, **model_kwargs)
+        print(f"[SUCCESS] Loaded re-ranker {RERANK_MODEL_NAME} on {model_kwargs['device']}")
+        return _reranker
+    except Exception as e:
+        _reranker_failed = True
+        print(f"[ERROR] Failed to load re-ranker, re-ranking is disabled: {e}")
+        return None
+
+def _max_pairs_within_budget(budget_seconds, top_n):
+    """Number of pairs the running latency estimate says fit in the budget (never fewer than top_n)."""
+    seconds_per_pair = rerank_stats["seconds_per_pair"]
+    if not seconds_per_pair:
+        return None
+    return max(top_n, int(budget_seconds / seconds_per_pair))
+
+def rerank(query, hits, top_n=RERANK_TOP_N, budget_ms=RERANK_BUDGET_MS):
+    """
+    Re-orders retrieval hits by cross-encoder relevance to the query.
+
+    Args:
+        query (str): The user's question.
+        hits (list): Hit dicts with ``text``, best first (as returned by search_papers).
+        top_n (int): Number of hits to keep.
+        budget_ms (int): Latency budget for scoring; candidates beyond what the
+            budget allows are dropped before scoring.
+
+    Returns:
+        list: Up to top_n hits, each with an added ``rerank_score``, best first.
+        If the model is unavailable or fails, the first top_n hits in their
+        original order.
+    """
+    if not hits:
+        return []
+    model = get_reranker()
+    if model is None:
+        return hits[:top_n]
+
+    candidates = hits
+    max_pairs = _max_pairs_within_budget(budget_ms / 1000, top_n)
+    if max_pairs is not None and len(candidates) > max_pairs:
+        rerank_stats["candidates_trimmed"] += len(candidates) - max_pairs
+        print(f"[DEBUG] Re-ranking {max_pairs} of {len(candidates)} candidates to stay within {budget_ms}ms")
+        candidates = candidates[:max_pairs]
+
+    started = time.perf_counter()
+    try:
+        # A single batch: one forward pass over every (query, chunk) pair
+        scores = model.predict([(query, hit["text"]) for hit in candidates], batch_size=len(candidates),
+                               convert_to_numpy=True, show_progress_bar=False)
+    except Exception as e:
+        print(f"[ERROR] Re-ranking failed: {e}")
+        return hits[:top_n]
+    elapsed = time.perf_counter() - started
+
+    seconds_per_pair = elapsed / len(candidates)
+    previous_estimate = rerank_stats["seconds_per_pair"]
+    rerank_stats["seconds_per_pair"] = (seconds_per_pair if previous_estimate is None else
+                                        LATENCY_SMOOTHING * seconds_per_pair +
+                                        (1 - LATENCY_SMOOTHING) * previous_estimate)
+    rerank_stats["calls"] += 1
+    rerank_stats["pairs_scored"] += len(candidates)
+    if elapsed * 1000 > budget_ms:
+        rerank_stats["over_budget"] += 1
+        print(f"[WARNING] Re-ranking {len(candidates)} candidates took {elapsed * 1000:.0f}ms (budget {budget_ms}ms)")
+    else:
+        print(f"[DEBUG] Re-ranked {len(candidates)} candidates in {elapsed * 1000:.0f}ms")
+
+    ranked = sorted(zip(candidates, scores), key=lambda pair: float(pair[1]), reverse=True)
+    return [dict(hit, rerank_score=float(score)) for hit, score in ranked[:top_n]]
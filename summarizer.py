@@ -0,0 +1,310 @@
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from chunk_store import ChunkStore
+from prompt_builder import pack_context, count_tokens
+from qa_system import get_gemini_model, get_gemini_model_name, stream_gemini_response, get_answer_length_target
+from utils import get_artifact_paths, SUMMARY_CONCURRENCY, SUMMARY_SECTION_TOKENS, PROMPT_CONTEXT_TOKENS
+
+# Map-reduce summarisation of whole papers.
+#
+# Summary and comparison requests need the whole paper, not the top-k chunks.
+# Each paper is split into its sections using the section headings recorded
+# in the chunk store; every section is summarised by its own Gemini call (the
+# map step, run concurrently up to SUMMARY_CONCURRENCY calls), and the section
+# summaries of all selected papers are combined into the final answer (the
+# reduce step). Sections longer than SUMMARY_SECTION_TOKENS are split into
+# several map calls. The reduce prompt is held to PROMPT_CONTEXT_TOKENS: each
+# paper gets an equal share, and a paper whose section summaries exceed it is
+# first condensed into one shorter summary by an intermediate reduce call.
+# Section summaries are cached on disk per paper, keyed by the section text,
+# so repeat summaries only pay for the reduce call(s).
+
+# Bump when the section prompt changes so cached section summaries are rebuilt
+SUMMARY_PROMPT_VERSION = "1"
+# Sections shorter than this are merged into the previous one rather than summarised alone
+MIN_SECTION_TOKENS = 150
+SKIPPED_SECTIONS = {"references", "bibliography", "acknowledgements", "acknowledgments"}
+# Smallest share of the reduce prompt a paper gets, however many papers are compared
+MIN_PAPER_TOKENS = 150
+
+summary_stats = {"sections_cached": 0, "sections_summarized": 0, "failures": 0}
+_summary_file_locks = {}
+_summary_file_locks_lock = threading.Lock()
+
+def _summary_file_lock(summary_path):
+    """One lock per summary cache file, so concurrent requests for a paper do not interleave writes."""
+    with _summary_file_locks_lock:
+        return _summary_file_locks.setdefault(summary_path, threading.Lock())
+
+def _bare_title(title):
+    """Section title without its number, lower-cased."""
+    return re.sub(r"^(?:\d+(?:\.\d+)*\.?|[A-Z]\.\d+(?:\.\d+)*|[IVX]+\.)\s*", "", title).strip().lower()
+
+def get_paper_sections(pdf_path):
+    """
+    Groups a processed paper's chunks into sections in reading order.
+
+    Returns:
+        list: Dicts with ``title``, ``pages`` (first, last) and ``chunks`` (texts).
+        Reference lists are left out, and sections too short to summarise on
+        their own are merged into the section before them.
+    """
+    chunks_path = get_artifact_paths(pdf_path)["chunks"]
+    if not os.path.exists(chunks_path):
+        print(f"[ERROR] No chunk store for {pdf_path}; process the paper first")
+        return []
+    chunks = ChunkStore(chunks_path)
+    # Incremental updates append chunks, so order by position in the paper rather than by id
+    metadata = sorted((chunks.metadata(chunk_id) for chunk_id in range(len(chunks)) if chunks[chunk_id] is not None),
+                      key=lambda meta: (meta["page"], meta["char_start"]))
+
+    sections = []
+    for meta in metadata:
+        title = meta["section"] or "Front matter"
+        if sections and sections[-1]["title"] == title:
+            sections[-1]["chunks"].append(chunks[meta["chunk_id"]])
+            sections[-1]["pages"] = (sections[-1]["pages"][0], meta["page"])
+        else:
+            sections.append({"title": title, "pages": (meta["page"], meta["page"]),
+                             "chunks": [chunks[meta["chunk_id"]]]})
+    sections = [section for section in sections if _bare_title(section["title"]) not in SKIPPED_SECTIONS]
+
+    merged = []
+    for section in sections:
+        if merged and count_tokens(" ".join(section["chunks"])) < MIN_SECTION_TOKENS:
+            merged[-1]["title"] = f"{merged[-1]['title']}; {section['title']}"
+            merged[-1]["chunks"].extend(section["chunks"])
+            merged[-1]["pages"] = (merged[-1]["pages"][0], section["pages"][1])
+        else:
+            merged.append(section)
+    return merged
+
+def _split_section(section, max_tokens=SUMMARY_SECTION_TOKENS):
+    """
+    Splits a section into parts of at most max_tokens, each summarised by its own
+    map call, so long sections (or papers without detected headings) are not cut short.
+
+    Returns:
+        list: Dicts with ``title`` (numbered when there are several parts), ``pages`` and ``text``.
+    """
+    groups = [[]]
+    group_tokens = 0
+    for chunk in section["chunks"]:
+        tokens = count_tokens(chunk)
+        if groups[-1] and group_tokens + tokens > max_tokens:
+            groups.append([])
+            group_tokens = 0
+        groups[-1].append(chunk)
+        group_tokens += tokens
+    parts = []
+    for number, group in enumerate(groups, start=1):
+        # Drops the overlap neighbouring chunks share; a single chunk never exceeds the budget
+        text, _, _ = pack_context([(chunk, "chunks") for chunk in group], max_tokens)
+        title = section["title"] if len(groups) == 1 else f"{section['title']} (part {number} of {len(groups)})"
+        parts.append({"title": title, "pages": section["pages"], "text": text})
+    return parts
+
+def _section_key(section_text, title):
+    """Cache key of a section summary: its text, title, the prompt version and the model."""
+    key_source = f"{SUMMARY_PROMPT_VERSION}:{get_gemini_model_name()}:{title}:{section_text}"
+    return hashlib.sha1(key_source.encode("utf-8")).hexdigest()
+
+def build_section_prompt(title, section_text):
+    """Builds the map-step prompt summarising one section."""
+    return f"""
+        You are an AI research assistant. Summarise the following section of a research paper.
+
+        **Section:** {title}
+
+        **Section text:**
+        {section_text}
+
+        Write 100-200 words covering the section's purpose, methods, key numbers and findings.
+        Keep specific names, datasets and results. Base the summary STRICTLY on the section text.
+        """
+
+def summarize_section(title, section_text):
+    """Summarises one section with Gemini. Returns the summary, or None on failure."""
+    gemini_model = get_gemini_model()
+    if gemini_model is None:
+        return None
+    try:
+        response = gemini_model.generate_content(build_section_prompt(title, section_text))
+        summary = response.text.strip() if response and response.text else ""
+        return summary or None
+    except Exception as e:
+        print(f"[ERROR] Failed to summarise section {title}: {e}")
+        return None
+
+def _load_summary_cache(summary_path):
+    """Reads a paper's cached section summaries (key -> summary)."""
+    if not os.path.exists(summary_path):
+        return {}
+    try:
+        with open(summary_path, "r", encoding="utf-8") as f:
+            return json.load(f).get("sections", {})
+    except Exception as e:
+        print(f"[WARNING] Could not read section summaries {summary_path}: {e}")
+        return {}
+
+def get_section_summaries(pdf_path, max_workers=SUMMARY_CONCURRENCY):
+    """
+    Returns a paper's section summaries, summarising uncached sections concurrently.
+
+    Returns:
+        list: Dicts with ``title``, ``pages`` and ``summary`` in reading order;
+        sections whose summary failed are left out.
+    """
+    summary_path = get_artifact_paths(pdf_path)["summaries"]
+    sections = [part for section in get_paper_sections(pdf_path) for part in _split_section(section)]
+    for section in sections:
+        section["key"] = _section_key(section["text"], section["title"])
+
+    with _summary_file_lock(summary_path):
+        cached = _load_summary_cache(summary_path)
+        missing = [section for section in sections if section["key"] not in cached]
+        summary_stats["sections_cached"] += len(sections) - len(missing)
+        if missing:
+            started = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=max(1, max_workers)) as executor:
+                summaries = list(executor.map(lambda section: summarize_section(section["title"], section["text"]),
+                                              missing))
+            for section, summary in zip(missing, summaries):
+                if summary:
+                    cached[section["key"]] = summary
+                    summary_stats["sections_summarized"] += 1
+                else:
+                    summary_stats["failures"] += 1
+            print(f"[DEBUG] Summarised {len(missing)} sections of {os.path.basename(pdf_path)} in "
+                  f"{time.perf_counter() - started:.1f}s ({max_workers} concurrent calls)")
+            # Keep only the current sections, so summaries of replaced text do not pile up
+            current = {section["key"]: cached[section["key"]] for section in sections if section["key"] in cached}
+            with open(f"{summary_path}.tmp", "w", encoding="utf-8") as f:
+                json.dump({"pdf_path": pdf_path, "sections": current}, f)
+            os.replace(f"{summary_path}.tmp", summary_path)
+
+    return [{"title": section["title"], "pages": section["pages"], "summary": cached[section["key"]]}
+            for section in sections if section["key"] in cached]
+
+def _format_section_lines(sections):
+    """Renders section summaries as the bullet list used in the reduce prompt."""
+    return "\n".join(f"- **{section['title']}** (pages {section['pages'][0]}-{section['pages'][1]}): "
+                     f"{section['summary']}" for section in sections)
+
+def build_condense_prompt(name, sections, max_words):
+    """Builds the intermediate reduce prompt condensing one paper's section summaries."""
+    return f"""
+        You are an AI research assistant. Below are section-by-section summaries of the research paper {name}.
+
+        {_format_section_lines(sections)}
+
+        Combine them into a single summary of at most {max_words} words covering the paper's objectives,
+        methods, key numbers, findings and conclusions. Base the summary STRICTLY on the summaries above.
+        """
+
+def condense_paper(name, sections, budget_tokens):
+    """
+    Fits one paper's section summaries into budget_tokens for the reduce prompt.
+
+    Returns the sections unchanged if they fit, otherwise a single section
+    holding a condensed summary of the whole paper. If the condensing call
+    fails, the section summaries are packed into the budget instead.
+    """
+    if count_tokens(_format_section_lines(sections)) <= budget_tokens:
+        return sections
+    pages = (sections[0]["pages"][0], max(section["pages"][1] for section in sections))
+    summary = None
+    gemini_model = get_gemini_model()
+    if gemini_model is not None:
+        try:
+            # Words run at roughly 4/3 tokens, and the bullet markup takes a few more
+            prompt = build_condense_prompt(name, sections, max(50, budget_tokens * 2 // 3))
+            response = gemini_model.generate_content(prompt)
+            summary = response.text.strip() if response and response.text else None
+        except Exception as e:
+            print(f"[ERROR] Failed to condense section summaries of {name}: {e}")
+    if not summary:
+        summary_stats["failures"] += 1
+        summary = "\n".join(f"{section['title']}: {section['summary']}" for section in sections)
+    # Guards the budget whether the summary came from the model or the fallback
+    summary, _, _ = pack_context([(summary, "chunks")], budget_tokens)
+    return [{"title": "Whole paper (condensed)", "pages": pages, "summary": summary}]
+
+def fit_papers_to_budget(papers, budget_tokens=PROMPT_CONTEXT_TOKENS, max_workers=SUMMARY_CONCURRENCY):
+    """
+    Gives every paper an equal share of the reduce prompt budget, condensing
+    papers whose section summaries exceed their share (concurrently).
+
+    Returns:
+        list: (name, sections) pairs in the input order.
+    """
+    share = max(MIN_PAPER_TOKENS, budget_tokens // max(len(papers), 1))
+    with ThreadPoolExecutor(max_workers=max(1, max_workers)) as executor:
+        condensed = list(executor.map(lambda paper: condense_paper(paper[0], paper[1], share), papers))
+    return [(name, sections) for (name, _), sections in zip(papers, condensed)]
+
+def build_reduce_prompt(query, papers, min_words=None):
+    """Builds the reduce-step prompt combining the section summaries of one or more papers."""
+    paper_blocks = []
+    for name, sections in papers:
+        paper_blocks.append(f"### Paper: {name}\n{_format_section_lines(sections)}")
+    length_instruction = f"The answer should be at least {min_words} words long." if min_words else ""
+    task = ("Compare the papers, covering their objectives, methods, results and how they differ."
+            if len(papers) > 1 else
+            "Cover the main objectives and contributions, methodology, key findings and results, "
+            "and implications and conclusions.")
+    return f"""
+        You are an AI research assistant. Below are section-by-section summaries of the selected research papers.
+
+        {chr(10).join(paper_blocks)}
+
+        **User's request:**
+        {query}
+
+        Answer the request using these summaries. {task}
+        {length_instruction}
+        Base your response STRICTLY on the summaries above and mention which paper each point comes from.
+        """
+
+def summarize_papers(query, pdf_paths, paper_names=None, stream=False, metrics=None):
+    """
+    Answers a summary or comparison request over whole papers with map-reduce.
+
+    The map step (section summaries, mostly served from the on-disk cache)
+    runs eagerly; with ``stream=True`` an iterator over the reduce step's
+    answer fragments is returned, otherwise the answer text.
+
+    Args:
+        query (str): The user's request.
+        pdf_paths (list): Selected papers.
+        paper_names (dict): Optional display name per PDF path.
+        stream (bool): Stream the final answer.
+        metrics (dict): Receives ``map_seconds`` and the reduce step's
+            ``ttft``/``total`` latency, from ``metrics["started_at"]`` when set.
+    """
+    metrics = metrics if metrics is not None else {}
+    metrics.setdefault("started_at", time.perf_counter())
+    paper_names = paper_names or {}
+    papers = []
+    for pdf_path in pdf_paths:
+        sections = get_section_summaries(pdf_path)
+        if sections:
+            papers.append((paper_names.get(pdf_path, os.path.basename(pdf_path)), sections))
+    metrics["map_seconds"] = time.perf_counter() - metrics["started_at"]
+    if not papers:
+        message = "⚠️ Could not summarise the selected papers."
+        return iter([message]) if stream else message
+
+    section_count = sum(len(sections) for _, sections in papers)
+    papers = fit_papers_to_budget(papers)
+    prompt = build_reduce_prompt(query, papers, get_answer_length_target())
+    metrics["prompt_tokens"] = count_tokens(prompt)
+    print(f"[DEBUG] Reducing {section_count} section summaries of {len(papers)} papers "
+          f"({metrics['prompt_tokens']} prompt tokens)")
+    fragments = stream_gemini_response(prompt, metrics)
+    return fragments if stream else "".join(fragments).strip()
@@ -0,0 +1,133 @@
+import os
+import re
+import threading
+import pandas as pd
+from extract_text import format_table_markdown
+from utils import get_artifact_paths
+
+# Structured store of the tables extracted from a paper.
+#
+# Each paper's tables live in one Parquet file with a row per table: its page,
+# position on the page, caption number and text, header row and all cell rows
+# (as nested string lists). Captions and headers double as a small lookup
+# index, so a question about "Table 2" or "BLEU scores" can pull the matching
+# tables without re-reading the Markdown dump.
+
+TABLE_COLUMNS = ["paper_id", "page", "table_index", "table_number", "caption", "header", "rows"]
+TABLE_REFERENCE = re.compile(r"\btable\s+([0-9]+|[ivx]+)\b", re.IGNORECASE)
+STOPWORDS = {
+    "the", "and", "for", "with", "what", "which", "how", "are", "was", "were", "does", "did", "this", "that",
+    "from", "show", "shows", "table", "tables", "paper", "results", "result", "about", "between", "into", "than",
+}
+
+_table_cache = {}  # table store path -> (signature, DataFrame)
+_table_cache_lock = threading.Lock()
+
+def write_table_store(table_store_path, page_entries, paper_id=""):
+    """
+    Writes the tables recorded on a paper's page entries to a Parquet file.
+
+    Args:
+        table_store_path (str): Destination .parquet path.
+        page_entries (list): Page manifest entries with ``page_number`` and ``tables``.
+        paper_id (str): Identifier of the paper the tables belong to.
+    """
+    records = [{
+        "paper_id": paper_id,
+        "page": entry["page_number"],
+        "table_index": table["index"],
+        "table_number": str(table["number"]) if table.get("number") else "",
+        "caption": table.get("caption", ""),
+        "header": table.get("header", []),
+        "rows": table.get("rows", []),
+    } for entry in page_entries for table in entry.get("tables", [])]
+    tables = pd.DataFrame(records, columns=TABLE_COLUMNS)
+    # Write to a temporary name and swap in, so readers never see a partial file
+    tables.to_parquet(f"{table_store_path}.tmp", engine="pyarrow", index=False)
+    os.replace(f"{table_store_path}.tmp", table_store_path)
+
+def load_table_store(pdf_path):
+    """Returns the DataFrame of a processed PDF's tables, or None if it has no table store."""
+    table_store_path = get_artifact_paths(pdf_path)["table_store"]
+    if not os.path.exists(table_store_path):
+        return None
+    stat = os.stat(table_store_path)
+    signature = (stat.st_mtime_ns, stat.st_size)
+    with _table_cache_lock:
+        cached = _table_cache.get(table_store_path)
+        if cached is not None and cached[0] == signature:
+            return cached[1]
+    try:
+        tables = pd.read_parquet(table_store_path, engine="pyarrow")
+    except Exception as e:
+        print(f"[ERROR] Could not read table store {table_store_path}: {e}")
+        return None
+    with _table_cache_lock:
+        _table_cache[table_store_path] = (signature, tables)
+    return tables
+
+def _table_record(pdf_path, row, score):
+    """Converts a table store row into a search hit with the table rendered as Markdown."""
+    table = {"caption": row["caption"], "rows": [list(cells) for cells in row["rows"]]}
+    return {
+        "pdf_path": pdf_path,
+        "page": int(row["page"]),
+        "table_number": row["table_number"],
+        "caption": row["caption"],
+        "score": score,
+        "markdown": format_table_markdown(table),
+    }
+
+def _terms(text):
+    """Lower-cased content words of a text."""
+    return {term for term in re.findall(r"[a-z0-9]+", text.lower()) if len(term) > 2 and term not in STOPWORDS}
+
+def get_table(pdf_path, table_number):
+    """Returns the table captioned "Table <table_number>" in a paper, or None."""
+    tables = load_table_store(pdf_path)
+    if tables is None:
+        return None
+    matches = tables[tables["table_number"].str.lower() == str(table_number).lower()]
+    if matches.empty:
+        return None
+    return _table_record(pdf_path, matches.iloc[0], 2.0)
+
+def search_tables(query, pdf_paths, k=3, min_score=0.2):
+    """
+    Finds the tables most relevant to a query across papers.
+
+    Explicit references such as "Table 2" score 2.0 and come first; other
+    tables score between 0 and 1 by the share of the query's content words
+    found in their caption (weighted double) or header row.
+
+    Args:
+        query (str): The user's question.
+        pdf_paths (list): Papers to search.
+        k (int): Maximum number of tables to return.
+        min_score (float): Minimum score for a table matched by keywords.
+
+    Returns:
+        list: Hits with ``pdf_path``, ``page``, ``table_number``, ``caption``,
+        ``score`` and ``markdown``, best first.
+    """
+    referenced = {number.lower() for number in TABLE_REFERENCE.findall(query)}
+    query_terms = _terms(query)
+    hits = []
+    for pdf_path in pdf_paths:
+        tables = load_table_store(pdf_path)
+        if tables is None or tables.empty:
+            continue
+        for _, row in tables.iterrows():
+            if row["table_number"] and row["table_number"].lower() in referenced:
+                score = 2.0
+            elif query_terms:
+                caption_terms = _terms(row["caption"])
+                header_terms = _terms(" ".join(row["header"]))
+                matched = sum(2 if term in caption_terms else 1 if term in header_terms else 0 for term in query_terms)
+                score = matched / (2 * len(query_terms))
+            else:
+                score = 0.0
+            if score >= min_score:
+                hits.append(_table_record(pdf_path, row, score))
+    hits.sort(key=lambda hit: hit["score"], reverse=True)
+    return hits[:k]
@@ -1,5 +1,6 @@
 import hashlib
 import os
+import re
 import streamlit as st
 
 # Safely resolve API keys from environment first, then Streamlit secrets only if a secrets.toml exists
@@ -26,18 +27,149 @@ def _get_secret_or_env(secret_key, env_key):
 GOOGLE_API_KEY = _get_secret_or_env("GOOGLE_API_KEY", "GOOGLE_API_KEY")
 HUGGINGFACE_API_KEY = _get_secret_or_env("HUGGINGFACE_API_KEY", "HUGGINGFACE_API_KEY")
 
-def get_chunks_filename(pdf_path):
-    """Generates a unique filename for text chunks based on the PDF path."""
-    pdf_hash = hashlib.md5(pdf_path.encode()).hexdigest()
-    return f"chunks_{pdf_hash}.pkl"
+def _get_int_env(env_key, default):
+    """Reads a positive integer setting from the environment, falling back to a default."""
+    try:
+        value = int(os.getenv(env_key, "").strip() or default)
+        return value if value > 0 else default
+    except ValueError:
+        return default
 
-def get_faiss_index_filename(pdf_path):
-    """Generates a unique filename for FAISS index based on the PDF path."""
+def _get_float_env(env_key, default):
+    """Reads a positive number setting from the environment, falling back to a default."""
+    try:
+        value = float(os.getenv(env_key, "").strip() or default)
+        return value if value > 0 else default
+    except ValueError:
+        return default
+
+# Number of worker processes used for parallel ingestion
+INGEST_WORKERS = _get_int_env("ARXIVLENS_INGEST_WORKERS", os.cpu_count() or 1)
+# Concurrent Tesseract processes used for image OCR
+OCR_WORKERS = _get_int_env("ARXIVLENS_OCR_WORKERS", min(4, os.cpu_count() or 1))
+# Set ARXIVLENS_PERSIST_IMAGES=1 to keep extracted images on disk; OCR works on in-memory bytes either way
+PERSIST_IMAGES = os.getenv("ARXIVLENS_PERSIST_IMAGES", "0").strip() == "1"
+# FAISS index backend: "auto", "flat", "ivf_flat", "ivf_pq" or "hnsw"
+FAISS_INDEX_TYPE = os.getenv("ARXIVLENS_INDEX_TYPE", "auto").strip().lower() or "auto"
+# Query-time recall/latency knobs for IVF (nprobe) and HNSW (efSearch) indexes
+SEARCH_NPROBE = _get_int_env("ARXIVLENS_SEARCH_NPROBE", 16)
+SEARCH_EF_SEARCH = _get_int_env("ARXIVLENS_SEARCH_EF_SEARCH", 64)
+# Retrieval mode: "dense" (FAISS), "lexical" (BM25) or "hybrid" (both, fused by reciprocal rank)
+RETRIEVAL_MODE = os.getenv("ARXIVLENS_RETRIEVAL_MODE", "hybrid").strip().lower() or "hybrid"
+# Cross-encoder re-ranking (ARXIVLENS_RERANK=0 disables it): hits retrieved as candidates, hits kept,
+# and the scoring latency budget in milliseconds that trims the candidate list
+RERANK_ENABLED = os.getenv("ARXIVLENS_RERANK", "1").strip() != "0"
+RERANK_MODEL_NAME = os.getenv("ARXIVLENS_RERANK_MODEL", "").strip() or "cross-encoder/ms-marco-MiniLM-L-6-v2"
+RERANK_CANDIDATES = _get_int_env("ARXIVLENS_RERANK_CANDIDATES", 20)
+RERANK_TOP_N = _get_int_env("ARXIVLENS_RERANK_TOP_N", 3)
+RERANK_BUDGET_MS = _get_int_env("ARXIVLENS_RERANK_BUDGET_MS", 300)
+# RoBERTa span extraction: "batched" (per chunk, one call), "full" (the whole combined context) or "off"
+SPAN_EXTRACTION_POLICY = os.getenv("ARXIVLENS_SPAN_EXTRACTION", "batched").strip().lower() or "batched"
+SPAN_CACHE_SIZE = _get_int_env("ARXIVLENS_SPAN_CACHE_SIZE", 256)
+# Token budget for the paper context in a Gemini prompt, and the shingle overlap treated as a duplicate passage
+PROMPT_CONTEXT_TOKENS = _get_int_env("ARXIVLENS_PROMPT_CONTEXT_TOKENS", 6000)
+PROMPT_DEDUP_THRESHOLD = _get_float_env("ARXIVLENS_PROMPT_DEDUP_THRESHOLD", 0.8)
+# Concurrent Gemini calls when summarising a paper's sections, and the token budget of one section
+SUMMARY_CONCURRENCY = _get_int_env("ARXIVLENS_SUMMARY_CONCURRENCY", 4)
+SUMMARY_SECTION_TOKENS = _get_int_env("ARXIVLENS_SUMMARY_SECTION_TOKENS", 3000)
+# Embedding inference backend: "torch", or "onnx"/"openvino" for optimized CPU inference
+EMBEDDING_BACKEND = os.getenv("ARXIVLENS_EMBEDDING_BACKEND", "torch").strip().lower() or "torch"
+# Optional model file for non-torch backends, e.g. "onnx/model_qint8_avx512_vnni.onnx" for a quantized model
+EMBEDDING_MODEL_FILE = os.getenv("ARXIVLENS_EMBEDDING_MODEL_FILE", "").strip()
+# CPU processes used to encode large batches (1 disables the multi-process pool)
+EMBEDDING_PROCESSES = _get_int_env("ARXIVLENS_EMBEDDING_PROCESSES", 1)
+# Set ARXIVLENS_EMBEDDING_CACHE=0 to disable the on-disk embedding cache
+EMBEDDING_CACHE_ENABLED = os.getenv("ARXIVLENS_EMBEDDING_CACHE", "1").strip() != "0"
+# Memory budget for loaded FAISS indexes and chunk lists kept in-process
+INDEX_CACHE_MB = _get_int_env("ARXIVLENS_INDEX_CACHE_MB", 1024)
+# Chunking strategy ("structure" or the legacy "sentence") and chunk size in embedding-model tokens
+CHUNKER_STRATEGY = os.getenv("ARXIVLENS_CHUNKER", "structure").strip().lower() or "structure"
+CHUNK_MAX_TOKENS = _get_int_env("ARXIVLENS_CHUNK_MAX_TOKENS", 200)
+CHUNK_OVERLAP_TOKENS = _get_int_env("ARXIVLENS_CHUNK_OVERLAP_TOKENS", 32)
+# Answer length policy: "prompt" states the target in the prompt only, "continue" also asks Gemini to
+# continue a short answer (sending just the answer so far), "off" drops the target entirely
+ANSWER_LENGTH_POLICY = os.getenv("ARXIVLENS_ANSWER_POLICY", "prompt").strip().lower() or "prompt"
+ANSWER_MIN_WORDS = _get_int_env("ARXIVLENS_ANSWER_MIN_WORDS", 450)
+# Shared answer cache: entries, lifetime in seconds, and the query similarity that counts as the same question
+ANSWER_CACHE_SIZE = _get_int_env("ARXIVLENS_ANSWER_CACHE_SIZE", 512)
+ANSWER_CACHE_TTL = _get_int_env("ARXIVLENS_ANSWER_CACHE_TTL", 6 * 3600)
+ANSWER_CACHE_THRESHOLD = _get_float_env("ARXIVLENS_ANSWER_CACHE_THRESHOLD", 0.95)
+
+# Bump when extraction or chunking changes so cached artifacts are rebuilt
+PIPELINE_VERSION = "4"
+EMBEDDING_MODEL_NAME = "sentence-transformers/all-MiniLM-L6-v2"
+
+project_dir = os.path.dirname(os.path.abspath(__file__))
+faiss_indexes_dir = os.path.join(project_dir, "faiss_indexes")
+
+_content_hash_cache = {}  # (path, size, mtime) -> content hash
+
+def get_pdf_content_hash(pdf_path):
+    """Returns the SHA-256 of the PDF bytes, memoised on path, size and mtime."""
+    stat = os.stat(pdf_path)
+    cache_key = (os.path.abspath(pdf_path), stat.st_size, stat.st_mtime_ns)
+    if cache_key not in _content_hash_cache:
+        digest = hashlib.sha256()
+        with open(pdf_path, "rb") as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                digest.update(block)
+        _content_hash_cache[cache_key] = digest.hexdigest()
+    return _content_hash_cache[cache_key]
+
+def get_embedding_model_id():
+    """Identifies the embedding model together with any backend that changes its vectors."""
+    if EMBEDDING_BACKEND == "torch":
+        return EMBEDDING_MODEL_NAME
+    return f"{EMBEDDING_MODEL_NAME}:{EMBEDDING_BACKEND}:{EMBEDDING_MODEL_FILE or 'default'}"
+
+def get_pipeline_fingerprint():
+    """Identifies the extraction pipeline, chunking settings and embedding model that produced an artifact."""
+    chunking = f"{CHUNKER_STRATEGY}-{CHUNK_MAX_TOKENS}-{CHUNK_OVERLAP_TOKENS}"
+    return f"{PIPELINE_VERSION}:{chunking}:{get_embedding_model_id()}"
+
+def get_artifact_key(pdf_path):
+    """Generates a content-addressed key for a PDF's artifacts from its bytes and the pipeline fingerprint."""
     if pdf_path is None:
         raise ValueError("pdf_path is None. Ensure a PDF is uploaded before generating FAISS index filename.")
 
-    pdf_hash = hashlib.md5(pdf_path.encode()).hexdigest()
-    return f"faiss_index_{pdf_hash}.index"
+    key_source = f"{get_pdf_content_hash(pdf_path)}:{get_pipeline_fingerprint()}"
+    return hashlib.md5(key_source.encode()).hexdigest()
+
+def get_chunks_filename(pdf_path):
+    """Generates a unique filename for the text chunk store based on the PDF contents."""
+    return f"chunks_{get_faiss_index_filename(pdf_path)}.json"
+
+def get_faiss_index_filename(pdf_path):
+    """Generates a unique filename for FAISS index based on the PDF contents."""
+    return f"faiss_index_{get_artifact_key(pdf_path)}.index"
+
+def get_artifact_paths_for_key(artifact_key):
+    """Returns the on-disk paths of every artifact stored under an artifact key."""
+    base_filename = f"faiss_index_{artifact_key}.index"
+    return {
+        "index": os.path.join(faiss_indexes_dir, base_filename),
+        "chunks": os.path.join(faiss_indexes_dir, f"chunks_{base_filename}.json"),
+        "tables": os.path.join(faiss_indexes_dir, f"tables_{base_filename}.md"),
+        "table_store": os.path.join(faiss_indexes_dir, f"tables_{base_filename}.parquet"),
+        "image_texts": os.path.join(faiss_indexes_dir, f"image_texts_{base_filename}.txt"),
+        "pages": os.path.join(faiss_indexes_dir, f"pages_{base_filename}.json"),
+        "lexical": os.path.join(faiss_indexes_dir, f"lexical_{base_filename}.json"),
+        "summaries": os.path.join(faiss_indexes_dir, f"summaries_{base_filename}.json"),
+    }
+
+def get_artifact_paths(pdf_path):
+    """Returns the on-disk paths of every artifact built for a PDF."""
+    return get_artifact_paths_for_key(get_artifact_key(pdf_path))
+
+def get_version_pointer_filename(pdf_path):
+    """Generates the filename recording which artifact key was last built for a PDF path."""
+    path_hash = hashlib.md5(os.path.abspath(pdf_path).encode()).hexdigest()
+    return os.path.join(faiss_indexes_dir, f"latest_{path_hash}.txt")
+
+def is_pdf_processed(pdf_path):
+    """Returns True if the FAISS index and chunks for the PDF's current contents exist."""
+    paths = get_artifact_paths(pdf_path)
+    return os.path.exists(paths["index"]) and os.path.exists(paths["chunks"])
 
 def expand_query(query, memory, max_expansions=3):
     """
@@ -68,3 +200,13 @@ full_context_keywords = [
     "limitations", "weaknesses", "challenges", "trade-offs", "bottlenecks",
     "what are the drawbacks", "how can this be improved"
 ]
+
+# Requests answered from whole-paper section summaries rather than retrieved chunks: an explicit
+# summary request, or a comparison that names the papers themselves ("compare both papers")
+SUMMARY_REQUEST = re.compile(r"\b(?:summari[sz]e|summary|overview|tl;?dr)\b", re.IGNORECASE)
+PAPER_COMPARISON_REQUEST = re.compile(
+    r"\b(?:compare|contrast|differences?|similarities)\b.*\b(?:papers|both|them|these two)\b", re.IGNORECASE)
+
+def is_summary_request(query):
+    """Detects whole-paper summary and paper comparison requests by whole-word matches."""
+    return bool(SUMMARY_REQUEST.search(query) or PAPER_COMPARISON_REQUEST.search(query))
@@ -1,10 +1,20 @@
 from sentence_transformers import SentenceTransformer
 import faiss
 import numpy as np
-import pickle
 import hashlib
 import os
-from utils import get_faiss_index_filename, expand_query, GOOGLE_API_KEY, HUGGINGFACE_API_KEY
+import heapq
+import threading
+import time
+import atexit
+from cachetools import LRUCache
+from utils import (get_faiss_index_filename, get_artifact_paths, expand_query, get_embedding_model_id,
+                   EMBEDDING_MODEL_NAME, EMBEDDING_BACKEND, EMBEDDING_MODEL_FILE, EMBEDDING_PROCESSES,
+                   EMBEDDING_CACHE_ENABLED, FAISS_INDEX_TYPE, SEARCH_NPROBE, SEARCH_EF_SEARCH, INDEX_CACHE_MB,
+                   RETRIEVAL_MODE, GOOGLE_API_KEY, HUGGINGFACE_API_KEY)
+from embedding_cache import encode_with_cache
+from lexical_index import load_lexical_index, bm25_search, reciprocal_rank_fusion
+from chunk_store import ChunkStore
 import streamlit as st
 import torch
 import torch.nn.functional as F
@@ -21,19 +31,33 @@ def setv_api_keys(gapi_key=None, hapi_key=None):
     if hapi_key:
         huggingface_api_key = hapi_key
 
+def get_embedding_device():
+    """Picks the fastest available device for the embedding model."""
+    if torch.cuda.is_available():
+        return "cuda"
+    if torch.backends.mps.is_available():
+        return "mps"
+    return "cpu"
+
 _embedding_model = None
 def initialize_embedding_model():
-    """Initialize the sentence transformer model with proper error handling."""
+    """Initialize the sentence transformer model on the best device and backend, with proper error handling."""
     global _embedding_model
     if _embedding_model is not None:
         return _embedding_model
     try:
+        model_kwargs = {"device": get_embedding_device()}
+        if EMBEDDING_BACKEND != "torch":
+            # ONNX/OpenVINO backends run optimized (optionally quantized) CPU inference
+            model_kwargs["backend"] = EMBEDDING_BACKEND
+            if EMBEDDING_MODEL_FILE:
+                model_kwargs["model_kwargs"] = {"file_name": EMBEDDING_MODEL_FILE}
         # Allow anonymous loading if token is not provided (for local runs)
         if huggingface_api_key:
-            _embedding_model = SentenceTransformer("sentence-transformers/all-MiniLM-L6-v2", token=huggingface_api_key)
+            _embedding_model = SentenceTransformer(EMBEDDING_MODEL_NAME, token=huggingface_api_key, **model_kwargs)
         else:
-            _embedding_model = SentenceTransformer("sentence-transformers/all-MiniLM-L6-v2")
-        print("[SUCCESS] Successfully initialized embedding model")
+            _embedding_model = SentenceTransformer(EMBEDDING_MODEL_NAME, **model_kwargs)
+        print(f"[SUCCESS] Successfully initialized embedding model on {model_kwargs['device']} ({EMBEDDING_BACKEND})")
         return _embedding_model
     except Exception as e:
         print(f"[ERROR] Failed to initialize embedding model: {e}")
@@ -47,15 +71,130 @@ project_dir = os.path.dirname(os.path.abspath(__file__))
 faiss_indexes_dir = os.path.join(project_dir, "faiss_indexes")
 os.makedirs(faiss_indexes_dir, exist_ok=True)
 
+def _encode_cached(texts, model, encode_fn):
+    """Encodes texts through the on-disk embedding cache unless it is disabled."""
+    if not EMBEDDING_CACHE_ENABLED:
+        return encode_fn(texts)
+    # Vectors are only interchangeable between identical models and settings
+    model_id = f"{get_embedding_model_id()}:normalized"
+    return encode_with_cache(texts, encode_fn, model_id, model.get_sentence_embedding_dimension())
+
+MIN_BATCH_SIZE = 8
+MAX_BATCH_SIZE = 256
+# Share of free memory one encoding batch may use for activations
+BATCH_MEMORY_FRACTION = 0.25
+# Rough number of float activations held per token per transformer layer
+ACTIVATIONS_PER_TOKEN_PER_LAYER = 12
+# Batches at least this large are spread over the multi-process CPU pool
+MULTI_PROCESS_MIN_TEXTS = 256
+PROGRESS_BAR_MIN_TEXTS = 1000
+
+def _available_memory_bytes(device):
+    """Returns free memory on the encoding device (free RAM for CPU)."""
+    try:
+        device = torch.device(device)  # e.g. "cuda:0", as reported by model.device
+        if device.type == "cuda":
+            return torch.cuda.mem_get_info(device)[0]
+        return os.sysconf("SC_AVPHYS_PAGES") * os.sysconf("SC_PAGE_SIZE")
+    except (AttributeError, ValueError, OSError, RuntimeError):
+        return 2 * 1024 ** 3  # Conservative default when the platform cannot report it
+
+def choose_batch_size(max_tokens, model=None):
+    """
+    Sizes an encoding batch so the activations of its longest sequences fit
+    in a fraction of free device memory. Returns a power of two.
+    """
+    model = model or _embedding_model
+    hidden_size = model.get_sentence_embedding_dimension()
+    try:
+        num_layers = model[0].auto_model.config.num_hidden_layers
+    except (AttributeError, IndexError, TypeError):
+        num_layers = 12
+    bytes_per_sequence = 4 * max_tokens * num_layers * (hidden_size * ACTIVATIONS_PER_TOKEN_PER_LAYER + max_tokens)
+    budget = _available_memory_bytes(model.device) * BATCH_MEMORY_FRACTION
+    batch_size = int(min(MAX_BATCH_SIZE, max(MIN_BATCH_SIZE, budget // max(bytes_per_sequence, 1))))
+    return 1 << (batch_size.bit_length() - 1)
+
+def _token_lengths(model, texts):
+    """Counts model tokens per text (capped at the model's max length), falling back to a character estimate."""
+    try:
+        encoded = model.tokenizer(texts, add_special_tokens=True, truncation=True, max_length=model.max_seq_length,
+                                  return_attention_mask=False, return_token_type_ids=False)
+        return np.array([len(ids) for ids in encoded["input_ids"]])
+    except Exception:
+        return np.array([min(len(text) // 4 + 2, model.max_seq_length) for text in texts])
+
+def get_token_counter(model=None):
+    """
+    Returns a function counting the embedding model's tokens in a text (without
+    truncation), so chunks can be sized to what the model actually sees.
+    Returns None if no tokenizer is available.
+    """
+    model = model or initialize_embedding_model()
+    tokenizer = getattr(model, "tokenizer", None)
+    if tokenizer is None:
+        return None
+
+    def count_tokens(text):
+        return len(tokenizer(text, add_special_tokens=True, truncation=False, verbose=False)["input_ids"])
+    return count_tokens
+
+_multi_process_pool = None
+def _get_multi_process_pool(model):
+    """Starts the sentence-transformers CPU process pool once and reuses it."""
+    global _multi_process_pool
+    if _multi_process_pool is None:
+        _multi_process_pool = model.start_multi_process_pool(["cpu"] * EMBEDDING_PROCESSES)
+        atexit.register(model.stop_multi_process_pool, _multi_process_pool)
+    return _multi_process_pool
+
+def encode_texts(texts, model=None):
+    """
+    Encodes texts into normalized embeddings, minimising padding and sizing batches to memory.
+
+    Texts are sorted by token length and encoded in length buckets, each with
+    a batch size chosen for its longest sequence. Large CPU workloads are spread
+    over a multi-process pool when ARXIVLENS_EMBEDDING_PROCESSES > 1. Output
+    rows follow the input order.
+    """
+    model = model or _embedding_model
+    lengths = _token_lengths(model, texts)
+    order = np.argsort(lengths, kind="stable")
+    embeddings = np.empty((len(texts), model.get_sentence_embedding_dimension()), dtype="float32")
+    show_progress_bar = len(texts) >= PROGRESS_BAR_MIN_TEXTS
+
+    if EMBEDDING_PROCESSES > 1 and str(model.device) == "cpu" and len(texts) >= MULTI_PROCESS_MIN_TEXTS:
+        batch_size = choose_batch_size(int(lengths.max()), model)
+        print(f"[DEBUG] Encoding {len(texts)} texts across {EMBEDDING_PROCESSES} processes (batch size {batch_size})")
+        embeddings[order] = model.encode_multi_process([texts[i] for i in order], _get_multi_process_pool(model),
+                                                       batch_size=batch_size, normalize_embeddings=True)
+        return embeddings
+
+    # Bucket by the next power of two of the token length so each bucket gets its own batch size
+    buckets = {}
+    for position in order:
+        buckets.setdefault(1 << max(5, int(lengths[position] - 1).bit_length()), []).append(position)
+    for bucket_length, positions in buckets.items():
+        batch_size = choose_batch_size(min(bucket_length, model.max_seq_length), model)
+        print(f"[DEBUG] Encoding {len(positions)} texts of <= {bucket_length} tokens (batch size {batch_size})")
+        embeddings[positions] = model.encode([texts[i] for i in positions], batch_size=batch_size,
+                                             convert_to_numpy=True, normalize_embeddings=True,
+                                             show_progress_bar=show_progress_bar)
+    return embeddings
+
 def encode_chunks_parallel(text_chunks):
-    """Encodes text chunks efficiently in batches."""
+    """Encodes text chunks efficiently in batches, reusing cached embeddings of repeated text."""
     if _embedding_model is None:
         print("[ERROR] Embedding model is not initialized")
         return None
         
     try:
         print(f"[DEBUG] Encoding {len(text_chunks)} chunks in batches")
-        embeddings = _embedding_model.encode(text_chunks, batch_size=16, show_progress_bar=True)
+        # Unit-length vectors make inner-product search equal to cosine similarity
+        embeddings = _encode_cached(text_chunks, _embedding_model, encode_texts)
+        if embeddings is None:
+            print("[ERROR] Failed to encode chunks")
+            return None
         print(f"[DEBUG] Successfully encoded chunks to shape {embeddings.shape}")
         return embeddings
     except Exception as e:
@@ -70,8 +209,10 @@ def encode_query(query, model):
         if not query:
             return None
             
-        # Get embedding using sentence transformer directly
-        embedding = model.encode([query], convert_to_numpy=True, normalize_embeddings=True)
+        # Get embedding using sentence transformer, reusing cached embeddings of repeated queries
+        embedding = _encode_cached(
+            [query], model,
+            lambda texts: model.encode(texts, convert_to_numpy=True, normalize_embeddings=True))
         if embedding is None or embedding.size == 0:
             print("[ERROR] Failed to generate query embedding")
             return None
@@ -82,8 +223,191 @@ def encode_query(query, model):
         print(f"[ERROR] Query encoding failed: {e}")
         return None
 
-def build_faiss_index(text_chunks, pdf_path):
-    """Build a FAISS index from text chunks."""
+INDEX_TYPES = ("flat", "ivf_flat", "ivf_pq", "hnsw")
+# Corpus sizes at which "auto" switches from brute force to ANN backends
+HNSW_MIN_VECTORS = 20000
+IVF_PQ_MIN_VECTORS = 1000000
+HNSW_M = 32
+HNSW_EF_CONSTRUCTION = 40
+# FAISS recommends 39-256 training points per IVF centroid
+IVF_TRAINING_POINTS_PER_LIST = 64
+PQ_NBITS = 8
+
+def choose_index_type(num_vectors):
+    """Picks an index backend for a corpus size: exact search while it is cheap, ANN beyond that."""
+    if num_vectors < HNSW_MIN_VECTORS:
+        return "flat"
+    if num_vectors < IVF_PQ_MIN_VECTORS:
+        return "hnsw"
+    return "ivf_pq"
+
+def _choose_nlist(num_vectors):
+    """Number of IVF lists: ~4*sqrt(n), keeping at least 39 training points per list."""
+    return int(max(1, min(4 * np.sqrt(num_vectors), num_vectors // 39)))
+
+def _choose_pq_subquantizers(dimension):
+    """Largest sub-quantizer count dividing the dimension with at least 4 dims per sub-vector."""
+    for m in range(dimension // 4, 0, -1):
+        if dimension % m == 0:
+            return m
+    return 1
+
+def _training_sample(embeddings, nlist):
+    """Draws a reproducible random subset of vectors large enough to train nlist centroids."""
+    sample_size = min(len(embeddings), max(nlist * IVF_TRAINING_POINTS_PER_LIST, (1 << PQ_NBITS) * 39))
+    if sample_size >= len(embeddings):
+        return embeddings
+    rng = np.random.default_rng(0)
+    return embeddings[rng.choice(len(embeddings), sample_size, replace=False)]
+
+def create_faiss_index(embeddings, index_type="auto"):
+    """Creates and trains (if needed) an empty inner-product FAISS index of the requested type for normalized embeddings."""
+    num_vectors, dimension = embeddings.shape
+    if index_type == "auto":
+        index_type = choose_index_type(num_vectors)
+    if index_type not in INDEX_TYPES:
+        raise ValueError(f"Unknown FAISS index type: {index_type}. Expected one of {INDEX_TYPES}")
+
+    nlist = _choose_nlist(num_vectors)
+    if index_type == "ivf_pq" and num_vectors < (1 << PQ_NBITS) * 39:
+        print("[WARNING] Too few vectors to train product quantization, using ivf_flat")
+        index_type = "ivf_flat"
+
+    print(f"[DEBUG] Creating {index_type} index for {num_vectors} vectors")
+    if index_type == "flat":
+        return faiss.IndexFlatIP(dimension)
+    if index_type == "hnsw":
+        index = faiss.IndexHNSWFlat(dimension, HNSW_M, faiss.METRIC_INNER_PRODUCT)
+        index.hnsw.efConstruction = HNSW_EF_CONSTRUCTION
+        index.hnsw.efSearch = SEARCH_EF_SEARCH
+        return index
+
+    quantizer = faiss.IndexFlatIP(dimension)
+    if index_type == "ivf_flat":
+        index = faiss.IndexIVFFlat(quantizer, dimension, nlist, faiss.METRIC_INNER_PRODUCT)
+    else:
+        index = faiss.IndexIVFPQ(quantizer, dimension, nlist, _choose_pq_subquantizers(dimension), PQ_NBITS,
+                                 faiss.METRIC_INNER_PRODUCT)
+
+    sample = _training_sample(embeddings, nlist)
+    print(f"[DEBUG] Training {index_type} index with {nlist} lists on {len(sample)} vectors...")
+    index.train(sample)
+    index.nprobe = min(SEARCH_NPROBE, nlist)
+    return index
+
+def _unwrap_index(index):
+    """Returns the innermost index behind ID-map or pre-transform wrappers."""
+    index = faiss.downcast_index(index)
+    while hasattr(index, "index") and isinstance(getattr(index, "index"), faiss.Index):
+        index = faiss.downcast_index(index.index)
+    return index
+
+def get_index_type(index):
+    """Names the backend of an index as one of INDEX_TYPES, or "auto" if it is not one of them."""
+    inner = _unwrap_index(index)
+    if isinstance(inner, faiss.IndexHNSW):
+        return "hnsw"
+    if isinstance(inner, faiss.IndexIVFPQ):
+        return "ivf_pq"
+    if isinstance(inner, faiss.IndexIVF):
+        return "ivf_flat"
+    if isinstance(inner, faiss.IndexFlat):
+        return "flat"
+    return "auto"
+
+def get_search_parameters(index, nprobe=None, ef_search=None):
+    """
+    Builds per-query FAISS search parameters for IVF (nprobe) or HNSW (efSearch)
+    indexes. Passing parameters per search leaves shared cached indexes untouched.
+    Returns None for exact indexes.
+    """
+    inner = _unwrap_index(index)
+    if isinstance(inner, faiss.IndexIVF):
+        return faiss.SearchParametersIVF(nprobe=min(nprobe or SEARCH_NPROBE, inner.nlist))
+    if isinstance(inner, faiss.IndexHNSW):
+        return faiss.SearchParametersHNSW(efSearch=ef_search or SEARCH_EF_SEARCH)
+    return None
+
+def evaluate_index(index, embeddings, k=10, num_queries=100, nprobe_values=(1, 4, 16, 64), ef_search_values=(16, 64, 256)):
+    """
+    Reports recall@k and per-query latency of an ANN index against an exact
+    flat baseline, for a sweep of nprobe or efSearch values.
+
+    Queries are sampled from the indexed embeddings. Returns a list of dicts
+    with ``params``, ``recall`` and ``latency_ms``; the first entry is the
+    flat baseline.
+    """
+    embeddings = np.ascontiguousarray(embeddings, dtype="float32")
+    rng = np.random.default_rng(0)
+    queries = embeddings[rng.choice(len(embeddings), min(num_queries, len(embeddings)), replace=False)]
+    k = min(k, len(embeddings))
+
+    baseline = faiss.IndexFlatIP(embeddings.shape[1])
+    baseline.add(embeddings)
+    start = time.perf_counter()
+    _, ground_truth = baseline.search(queries, k)
+    report = [{"params": "flat", "recall": 1.0, "latency_ms": (time.perf_counter() - start) * 1000 / len(queries)}]
+
+    inner = _unwrap_index(index)
+    if isinstance(inner, faiss.IndexIVF):
+        sweep = [{"nprobe": value} for value in nprobe_values if value <= inner.nlist]
+    elif isinstance(inner, faiss.IndexHNSW):
+        sweep = [{"ef_search": value} for value in ef_search_values]
+    else:
+        sweep = [{}]
+
+    for params in sweep:
+        start = time.perf_counter()
+        _, found = index.search(queries, k, params=get_search_parameters(index, **params))
+        latency_ms = (time.perf_counter() - start) * 1000 / len(queries)
+        recall = np.mean([len(set(found[i]) & set(ground_truth[i])) / k for i in range(len(queries))])
+        report.append({"params": params or "exact", "recall": float(recall), "latency_ms": latency_ms})
+
+    for row in report:
+        print(f"[DEBUG] {row['params']}: recall@{k}={row['recall']:.3f}, latency={row['latency_ms']:.3f} ms/query")
+    return report
+
+def add_to_index(index, embeddings, ids):
+    """Adds normalized embeddings to an ID-mapped index under the given chunk ids."""
+    index.add_with_ids(np.ascontiguousarray(embeddings, dtype="float32"), np.asarray(ids, dtype="int64"))
+    return index
+
+def remove_from_index(index, ids):
+    """
+    Removes chunk ids from an ID-mapped index and returns the updated index.
+
+    Only flat indexes remove natively. IVF lists keep their internal ids after
+    ``remove_ids`` while the ID map compacts, which would shift every later
+    chunk id, and HNSW cannot remove at all; both are rebuilt from their
+    remaining vectors (IVF reusing its trained quantizer), keeping every
+    surviving chunk id.
+    """
+    ids = np.asarray(list(ids), dtype="int64")
+    if len(ids) == 0:
+        return index
+    inner = _unwrap_index(index)
+    if isinstance(inner, faiss.IndexFlat):
+        index.remove_ids(ids)
+        return index
+
+    print(f"[DEBUG] Rebuilding {get_index_type(index)} index from remaining vectors")
+    all_ids = faiss.vector_to_array(index.id_map)
+    vectors = index.index.reconstruct_n(0, index.ntotal)
+    keep = ~np.isin(all_ids, ids)
+    if isinstance(inner, faiss.IndexIVF):
+        emptied = faiss.clone_index(index.index)
+        emptied.reset()
+    else:
+        emptied = create_faiss_index(vectors[keep], get_index_type(index))
+    return add_to_index(faiss.IndexIDMap2(emptied), vectors[keep], all_ids[keep])
+
+def build_faiss_index(text_chunks, pdf_path, index_type=FAISS_INDEX_TYPE):
+    """
+    Build a FAISS index from text chunks, using an ANN backend for large corpora.
+
+    The index is ID-mapped with chunk ids equal to list positions, so chunks
+    can later be added or removed incrementally.
+    """
     print("[DEBUG] Building FAISS index...")
     print(f"[DEBUG] Number of chunks: {len(text_chunks)}")
     
@@ -96,21 +420,17 @@ def build_faiss_index(text_chunks, pdf_path):
             return None, None, None
             
         print(f"[DEBUG] Generated embeddings with shape: {embeddings.shape}")
+        embeddings = np.ascontiguousarray(embeddings, dtype="float32")
         
-        # Create and train index
-        dimension = embeddings.shape[1]
-        index = faiss.IndexFlatL2(dimension)
-        
-        print("[DEBUG] Training FAISS index...")
-        if len(text_chunks) > 1:
-            index.train(embeddings)
+        # Create (and train, for IVF backends) the index
+        index = faiss.IndexIDMap2(create_faiss_index(embeddings, index_type))
         
         print("[DEBUG] Adding vectors to index...")
-        index.add(embeddings)
+        add_to_index(index, embeddings, np.arange(len(embeddings)))
         
         print("[DEBUG] Saving files...")
         print(f"[SUCCESS] FAISS index saved to {os.path.join(faiss_indexes_dir, get_faiss_index_filename(pdf_path))}")
-        print(f"[SUCCESS] Chunks saved to {os.path.join(faiss_indexes_dir, f'chunks_{get_faiss_index_filename(pdf_path)}.pkl')}")
+        print(f"[SUCCESS] Chunks saved to {get_artifact_paths(pdf_path)['chunks']}")
         
         return index, embeddings, text_chunks
         
@@ -118,8 +438,23 @@ def build_faiss_index(text_chunks, pdf_path):
         print(f"[ERROR] Failed to build FAISS index: {e}")
         return None, None, None
 
-def search_faiss(query, index, embedding_model, chunks, memory=None, k=5):
-    """Search for relevant chunks using FAISS."""
+def to_cosine_similarity(index, distances):
+    """
+    Converts raw FAISS distances into cosine similarities in [-1, 1].
+
+    Indexes are inner-product over normalized vectors, so distances already
+    are cosine; they are only clipped against rounding.
+    """
+    distances = np.asarray(distances, dtype="float32")
+    return np.clip(distances, -1.0, 1.0)
+
+def search_faiss(query, index, embedding_model, chunks, memory=None, k=5, nprobe=None, ef_search=None, return_scores=False):
+    """
+    Search for relevant chunks using FAISS.
+
+    With ``return_scores=True`` returns ``(chunk, cosine_similarity)`` tuples
+    instead of bare chunks.
+    """
     print(f"[DEBUG] Searching for query: {query}")
     print(f"[DEBUG] Total available chunks: {len(chunks)}")
     
@@ -131,18 +466,20 @@ def search_faiss(query, index, embedding_model, chunks, memory=None, k=5):
             return None
             
         # Search index
-        D, I = index.search(query_embedding.reshape(1, -1), k)
-        print(f"[DEBUG] Search results - distances: {D[0]}, indices: {I[0]}")
+        D, I = index.search(query_embedding.reshape(1, -1), k,
+                            params=get_search_parameters(index, nprobe, ef_search))
+        scores = to_cosine_similarity(index, D[0])
+        print(f"[DEBUG] Search results - scores: {scores}, indices: {I[0]}")
         
         # Get relevant chunks
         relevant_chunks = []
         for i, idx in enumerate(I[0]):
-            if idx < len(chunks):  # Validate index
+            if 0 <= idx < len(chunks) and chunks[idx] is not None:  # Validate index (FAISS pads missing hits with -1)
                 chunk = chunks[idx]
-                distance = D[0][i]
-                print(f"[DEBUG] Chunk {i+1} (distance={distance:.4f}):")
+                score = float(scores[i])
+                print(f"[DEBUG] Chunk {i+1} (score={score:.4f}):")
                 print(f"[DEBUG] {chunk[:200]}...")
-                relevant_chunks.append(chunk)
+                relevant_chunks.append((chunk, score) if return_scores else chunk)
             else:
                 print(f"[WARNING] Invalid chunk index: {idx}")
                 
@@ -157,21 +494,170 @@ def search_faiss(query, index, embedding_model, chunks, memory=None, k=5):
         print(f"[ERROR] FAISS search failed: {e}")
         return None
 
-faiss_index_cache = {}  # Cache to store loaded indexes
+index_cache_stats = {"hits": 0, "misses": 0, "evictions": 0, "invalidations": 0}
+
+class _IndexLRUCache(LRUCache):
+    """LRU cache of loaded (index, chunks) pairs that records evictions."""
+
+    def popitem(self):
+        key, value = super().popitem()
+        index_cache_stats["evictions"] += 1
+        print(f"[DEBUG] Evicted FAISS index from cache: {key}")
+        return key, value
+
+def _estimate_entry_size(entry):
+    """Approximates the resident size in bytes of a cached (signature, index, chunk store) entry."""
+    _, index, chunks = entry
+    return index.ntotal * index.d * 4 + chunks.resident_bytes()
+
+# Shared by every Streamlit session in this process, bounded by INDEX_CACHE_MB
+faiss_index_cache = _IndexLRUCache(maxsize=INDEX_CACHE_MB * 1024 * 1024, getsizeof=_estimate_entry_size)
+_faiss_index_cache_lock = threading.Lock()
+
+def _artifact_signature(*file_paths):
+    """Returns (mtime, size) for each file so rewritten artifacts invalidate the cache."""
+    signature = []
+    for file_path in file_paths:
+        stat = os.stat(file_path)
+        signature.append((stat.st_mtime_ns, stat.st_size))
+    return tuple(signature)
+
+def get_index_cache_stats():
+    """Returns hit/miss/eviction counters and current usage of the index cache."""
+    with _faiss_index_cache_lock:
+        return {
+            **index_cache_stats,
+            "entries": len(faiss_index_cache),
+            "bytes": faiss_index_cache.currsize,
+            "budget_bytes": faiss_index_cache.maxsize,
+        }
+
+def clear_index_cache():
+    """Drops every loaded index from the cache."""
+    with _faiss_index_cache_lock:
+        faiss_index_cache.clear()
 
 def load_faiss_index(pdf_path):
-    """Loads FAISS index and text chunks based on PDF path."""
-    base_filename = get_faiss_index_filename(pdf_path)
-    faiss_index_filename = os.path.join(faiss_indexes_dir, base_filename)
-    chunks_filename = os.path.join(faiss_indexes_dir, f"chunks_{base_filename}.pkl")
+    """
+    Loads the FAISS index and memory-mapped chunk store for the PDF's contents,
+    served from the LRU cache when unchanged.
+    """
+    paths = get_artifact_paths(pdf_path)
+    faiss_index_filename = paths["index"]
+    chunks_filename = paths["chunks"]
 
     if not os.path.exists(faiss_index_filename):
         raise FileNotFoundError(f" FAISS index file not found: {faiss_index_filename}")
     if not os.path.exists(chunks_filename):
         raise FileNotFoundError(f" Chunks file not found: {chunks_filename}")
 
+    signature = _artifact_signature(faiss_index_filename, chunks_filename)
+    with _faiss_index_cache_lock:
+        entry = faiss_index_cache.get(faiss_index_filename)
+        if entry is not None and entry[0] == signature:
+            index_cache_stats["hits"] += 1
+            return entry[1], entry[2]
+        if entry is not None:
+            index_cache_stats["invalidations"] += 1
+            del faiss_index_cache[faiss_index_filename]
+        index_cache_stats["misses"] += 1
+
     index = faiss.read_index(faiss_index_filename)
-    with open(chunks_filename, "rb") as f:
-        chunks = pickle.load(f)
+    chunks = ChunkStore(chunks_filename)
+
+    with _faiss_index_cache_lock:
+        try:
+            faiss_index_cache[faiss_index_filename] = (signature, index, chunks)
+        except ValueError:
+            print(f"[WARNING] FAISS index {faiss_index_filename} exceeds the cache budget, not caching")
 
     return index, chunks
+
+RETRIEVAL_MODES = ("dense", "lexical", "hybrid")
+# Candidates taken from each retriever per paper before fusion, as a multiple of k
+FUSION_CANDIDATES_PER_HIT = 4
+
+def _dense_candidates(query_embedding, index, chunks, k, nprobe, ef_search, min_score):
+    """Returns (chunk_id, cosine similarity) pairs from a paper's FAISS index, best first."""
+    if index.ntotal == 0:
+        return []
+    D, I = index.search(query_embedding, min(k, index.ntotal), params=get_search_parameters(index, nprobe, ef_search))
+    return [(int(idx), float(score)) for score, idx in zip(to_cosine_similarity(index, D[0]), I[0])
+            if 0 <= idx < len(chunks) and chunks[idx] is not None and (min_score is None or score >= min_score)]
+
+def search_papers(query, pdf_paths, embedding_model, memory=None, k=5, nprobe=None, ef_search=None, min_score=None,
+                  mode=RETRIEVAL_MODE):
+    """
+    Searches several papers by fanning the query out over each paper's indexes
+    and merging the per-paper hits into a single top-k.
+
+    ``mode`` selects the retriever: "dense" ranks by FAISS cosine similarity,
+    "lexical" by BM25 over the paper's inverted index, and "hybrid" fuses both
+    rankings (taken across all papers) with reciprocal rank fusion.
+
+    Returns a list of hit dicts with ``pdf_path``, ``chunk_id``, ``page``, ``score``
+    (cosine similarity in dense mode, BM25 in lexical mode, the fused score in
+    hybrid mode), ``dense_score``, ``lexical_score`` (None when that retriever
+    did not return the chunk) and ``text``, best first. Dense hits scoring below
+    ``min_score`` are dropped.
+    """
+    if mode not in RETRIEVAL_MODES:
+        raise ValueError(f"Unknown retrieval mode: {mode}. Expected one of {RETRIEVAL_MODES}")
+    print(f"[DEBUG] Searching {len(pdf_paths)} papers ({mode}) for query: {query}")
+    query_embedding = None
+    if mode != "lexical":
+        query_embedding = encode_query(query, embedding_model)
+        if query_embedding is None:
+            print("[ERROR] Failed to encode query")
+            return []
+        query_embedding = query_embedding.reshape(1, -1)
+
+    candidates = k if mode != "hybrid" else k * FUSION_CANDIDATES_PER_HIT
+    dense_scores = {}  # (pdf_path, chunk_id) -> score
+    lexical_scores = {}
+    paper_chunks = {}
+    for pdf_path in pdf_paths:
+        try:
+            index, chunks = load_faiss_index(pdf_path)
+        except Exception as e:
+            print(f"[ERROR] Could not load indexes for {pdf_path}: {e}")
+            continue
+        paper_chunks[pdf_path] = chunks
+        if mode != "lexical":
+            try:
+                for chunk_id, score in _dense_candidates(query_embedding, index, chunks, candidates, nprobe,
+                                                         ef_search, min_score):
+                    dense_scores[(pdf_path, chunk_id)] = score
+            except Exception as e:
+                print(f"[ERROR] FAISS search failed for {pdf_path}: {e}")
+        if mode != "dense":
+            lexical_index = load_lexical_index(get_artifact_paths(pdf_path)["lexical"], chunks)
+            if lexical_index is None:
+                continue
+            for chunk_id, score in bm25_search(query, lexical_index, candidates):
+                if 0 <= chunk_id < len(chunks) and chunks[chunk_id] is not None:
+                    lexical_scores[(pdf_path, chunk_id)] = score
+
+    if mode == "dense":
+        ranked = heapq.nlargest(k, dense_scores.items(), key=lambda item: item[1])
+    elif mode == "lexical":
+        ranked = heapq.nlargest(k, lexical_scores.items(), key=lambda item: item[1])
+    else:
+        rankings = [sorted(scores, key=scores.get, reverse=True) for scores in (dense_scores, lexical_scores)]
+        ranked = reciprocal_rank_fusion(rankings)[:k]
+
+    top_hits = []
+    for (pdf_path, chunk_id), score in ranked:
+        chunks = paper_chunks[pdf_path]
+        top_hits.append({
+            "pdf_path": pdf_path,
+            "chunk_id": chunk_id,
+            "page": chunks.metadata(chunk_id)["page"],
+            "score": float(score),
+            "dense_score": dense_scores.get((pdf_path, chunk_id)),
+            "lexical_score": lexical_scores.get((pdf_path, chunk_id)),
+            "text": chunks[chunk_id],
+        })
+    for hit in top_hits:
+        print(f"[DEBUG] Hit {os.path.basename(hit['pdf_path'])}#{hit['chunk_id']} (score={hit['score']:.4f})")
+    return top_hits